@@ -4,16 +4,21 @@ Spiral Codex Brain API - Multi-agent planning & execution
 Built with ƒCLAUDE (planning) + ƒCODEX (implementation)
 Enhanced with RAG (Retrieval-Augmented Generation) for context-aware planning
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from typing import Any, Dict, List, Optional
+import asyncio
 import yaml
 import json
 from pathlib import Path
 import hashlib
 from datetime import datetime
 import time
-from utils.rag import available as rag_available, enrich_prompt, retrieve, retrieve_legacy, reset_models
+from utils.rag import (
+    RETRIEVAL_MODES, available as rag_available, aretrieve, aretrieve_many,
+    enrich_prompt, retrieve, retrieve_legacy, reset_models
+)
 from utils.telemetry import log_wean
 
 router = APIRouter(prefix="/v1/brain", tags=["brain"])
@@ -54,44 +59,48 @@ class LedgerEntry(BaseModel):
 
 # --- Brain Planning Logic --------------------------------------------------
 
-def _make_plan(goal: str, max_steps: int, context: Dict[str, Any]) -> BrainPlan:
-    """Generate a multi-step plan (RAG-enhanced when available)"""
+def _make_plan(goal: str, max_steps: int, context: Dict[str, Any],
+               rag_results: Optional[List[Dict[str, Any]]] = None) -> BrainPlan:
+    """Generate a multi-step plan (RAG-enhanced when available)
+
+    rag_results may be passed in by callers that already retrieved context.
+    """
 
     # Check if RAG is available and enrich the goal
     base_goal = goal
     rag_used = False
     rag_method = "none"
 
-    if rag_available():
+    if rag_results is None and rag_available():
         # Use enhanced RAG for context retrieval
         rag_results = retrieve(goal, top_k=3)
-        if rag_results:
-            rag_method = rag_results[0].get('rank_method', 'bm25_only')
-
-            # Build context from retrieved snippets
-            context_snippets = []
-            for result in rag_results:
-                source = result.get('source', 'unknown')
-                content = result.get('content', '')
-                bm25_score = result.get('bm25_score', 0)
-                vector_score = result.get('vector_score', 0)
-
-                snippet = f"[{source}] {content}"
-                if bm25_score > 0:
-                    snippet += f" (BM25:{bm25_score:.3f}"
-                    if vector_score > 0:
-                        snippet += f", Vec:{vector_score:.3f}"
-                    snippet += ")"
-
-                context_snippets.append(snippet)
-
-            # Create enriched prompt with context
-            context_block = "## Retrieved Context (BM25 + Vector Tie-Break)\n\n"
-            context_block += "\n".join([f"• {snippet}" for snippet in context_snippets])
-            context_block += f"\n\n## Original Goal\n{goal}"
-
-            goal = context_block
-            rag_used = True
+    if rag_results:
+        rag_method = rag_results[0].get('rank_method', 'bm25_only')
+
+        # Build context from retrieved snippets
+        context_snippets = []
+        for result in rag_results:
+            source = result.get('source', 'unknown')
+            content = result.get('content', '')
+            bm25_score = result.get('bm25_score', 0)
+            vector_score = result.get('vector_score', 0)
+
+            snippet = f"[{source}] {content}"
+            if bm25_score > 0:
+                snippet += f" (BM25:{bm25_score:.3f}"
+                if vector_score > 0:
+                    snippet += f", Vec:{vector_score:.3f}"
+                snippet += ")"
+
+            context_snippets.append(snippet)
+
+        # Create enriched prompt with context
+        context_block = "## Retrieved Context (BM25 + Vector Tie-Break)\n\n"
+        context_block += "\n".join([f"• {snippet}" for snippet in context_snippets])
+        context_block += f"\n\n## Original Goal\n{goal}"
+
+        goal = context_block
+        rag_used = True
     
     steps = []
     
@@ -165,8 +174,19 @@ brain_ledger = BrainLedger()
 def health() -> Dict[str, Any]:
     return {"ok": True, "service": "brain", "version": 1, "glyph": "⊚"}
 
+async def _until_disconnect(request: Request, awaitable, poll_seconds: float = 0.25):
+    """Await work, cancelling it if the HTTP client goes away first"""
+    task = asyncio.ensure_future(awaitable)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_seconds)
+        if done:
+            return task.result()
+        if await request.is_disconnected():
+            task.cancel()
+            raise HTTPException(status_code=499, detail="Client disconnected")
+
 @router.post("/plan", response_model=BrainResponse)
-def plan(req: BrainRequest) -> BrainResponse:
+async def plan(req: BrainRequest, request: Request) -> BrainResponse:
     """Generate multi-step plan for a goal (RAG-enhanced when available)"""
     
     # Start telemetry timer
@@ -175,7 +195,11 @@ def plan(req: BrainRequest) -> BrainResponse:
     ok = False
     
     try:
-        plan = _make_plan(req.goal, req.max_steps, req.context or {})
+        # Retrieve once, off the event loop; the plan and artifacts share it
+        rag_results = []
+        if rag_used:
+            rag_results = await _until_disconnect(request, aretrieve(req.goal, top_k=3))
+        plan = _make_plan(req.goal, req.max_steps, req.context or {}, rag_results)
         
         # Generate thoughts
         thoughts = [
@@ -189,10 +213,7 @@ def plan(req: BrainRequest) -> BrainResponse:
         if req.hints:
             thoughts.append(Thought(role="planner", text=f"Considering hints: {', '.join(req.hints)}"))
         
-        # Get RAG results for artifacts if available
-        rag_results = []
-        if rag_used and rag_available():
-            rag_results = retrieve(req.goal, top_k=3)
+        rag_method = rag_results[0].get('rank_method', 'bm25_only') if rag_results else "none"
 
         # Artifacts
         artifacts = {
@@ -222,6 +243,9 @@ def plan(req: BrainRequest) -> BrainResponse:
         
         ok = True
         result = BrainResponse(plan=plan, thoughts=thoughts, artifacts=artifacts)
+    except HTTPException:
+        ok = False
+        raise
     except Exception as e:
         ok = False
         raise HTTPException(status_code=500, detail=str(e))
@@ -342,10 +366,10 @@ async def eval_rag(req: RAGEvalRequest):
     """Compare legacy vs enhanced RAG retrieval"""
     try:
         # Legacy retrieval
-        legacy_results = retrieve_legacy(req.query, top_k=req.top_k)
+        legacy_results = await run_in_threadpool(retrieve_legacy, req.query, top_k=req.top_k)
 
         # Enhanced retrieval
-        enhanced_results = retrieve(req.query, top_k=req.top_k)
+        enhanced_results = await aretrieve(req.query, top_k=req.top_k)
 
         # Comparison analysis
         comparison = {
@@ -379,15 +403,44 @@ async def eval_rag(req: RAGEvalRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG evaluation failed: {str(e)}")
 
+class RetrieveBatchRequest(BaseModel):
+    queries: List[str] = Field(description="Queries to retrieve context for")
+    top_k: int = 3
+    mode: str = Field(default="bm25", description="bm25 | vector | hybrid")
+
+MAX_BATCH_QUERIES = 64
+
+@router.post("/retrieve:batch")
+async def retrieve_batch(req: RetrieveBatchRequest, request: Request):
+    """Retrieve context for several queries in one pass (one batched query encode)"""
+    if req.mode not in RETRIEVAL_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode {req.mode!r}; expected one of {list(RETRIEVAL_MODES)}")
+    if len(req.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    try:
+        batches = await _until_disconnect(request, aretrieve_many(req.queries, top_k=req.top_k, mode=req.mode))
+        return {
+            "mode": req.mode,
+            "count": len(batches),
+            "results": [
+                {"query": query, "results": results}
+                for query, results in zip(req.queries, batches)
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch retrieval failed: {str(e)}")
+
 @router.post("/rag/reset")
 async def reset_rag():
-    """Reset RAG models to force retraining"""
+    """Reset cached RAG models so they are reloaded from the index artifact"""
     try:
         reset_models()
         return {
             "status": "success",
             "message": "RAG models reset successfully",
-            "next_query": "Models will be retrained on next retrieval"
+            "next_query": "Models will be reloaded on next retrieval (refit only if the corpus generation changed)"
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG reset failed: {str(e)}")
@@ -396,17 +449,25 @@ async def reset_rag():
 async def get_rag_status():
     """Get RAG system status"""
     try:
-        from utils.rag import BM25_TOP_K, VECTOR_MODEL, VECTOR_AVAILABLE
+        from utils.rag import (
+            BM25_TOP_K, EMBEDDINGS_DB, RAG_VECTOR_DTYPE, VECTOR_MODEL, VECTOR_AVAILABLE, cache_stats, index_status,
+            loaded_models, shard_stats
+        )
 
         status = {
             "available": rag_available(),
             "vector_available": VECTOR_AVAILABLE,
             "config": {
                 "bm25_top_k": BM25_TOP_K,
-                "vector_model": VECTOR_MODEL
+                "vector_model": VECTOR_MODEL,
+                "vector_dtype": RAG_VECTOR_DTYPE
             },
             "database_path": str(EMBEDDINGS_DB),
-            "models_loaded": False
+            "models_loaded": False,
+            "cache": cache_stats(),
+            "index": index_status(),
+            "shards": await run_in_threadpool(shard_stats),  # round trip to every shard worker
+            "loaded_models": loaded_models()
         }
 
         # Check if models are loaded
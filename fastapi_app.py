@@ -4,18 +4,42 @@ Spiral Codex Unified - FastAPI Application
 Multi-agent AI-assisted development framework
 Built with ƒCLAUDE + ƒCODEX collaboration
 """
+import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone
 from api.brain_api import router as brain_router
 from api.omai_api import router as omai_router
 from api.converse_api import router as converse_router
 from api.token_admin import admin as token_admin_router
+from utils import rag
+
+RAG_WARMUP = os.getenv("RAG_WARMUP", "1") not in ("0", "false", "False")  # load model + index at startup
+RAG_PRELOAD = os.getenv("RAG_PRELOAD", "0") not in ("0", "false", "False")  # warm up at import, before forking
+
+# With a pre-forking server (gunicorn --preload) this runs once in the master,
+# so every worker shares the model weights and mapped index copy-on-write
+if RAG_PRELOAD:
+    print(f"✓ RAG preloaded for forked workers: {rag.preload_for_fork()}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the embedding model and RAG index before serving the first request"""
+    if RAG_WARMUP:
+        try:
+            print(f"✓ RAG warm-up: {await run_in_threadpool(rag.warm_up)}")
+        except Exception as e:
+            print(f"⚠️  RAG warm-up failed: {e}")
+    yield
 
 app = FastAPI(
     title="Spiral Codex Unified",
     description="⊚ Multi-agent FastAPI brain with symbolic reasoning",
     version="0.4.0",
+    lifespan=lifespan,
 )
 
 # CORS middleware
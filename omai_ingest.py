@@ -48,6 +48,7 @@ class IngestResult:
 
     records: List[Dict[str, str]] = field(default_factory=list)
     skipped: List[Tuple[str, str]] = field(default_factory=list)  # (path, reason)
+    bytes_read: int = 0  # file bytes read during the run
 
 
 class OMAiIngestor:
@@ -67,10 +68,12 @@ class OMAiIngestor:
         self.extensions = {ext.lower() for ext in (extensions or DEFAULT_EXTENSIONS)}
         self.ignore_tags = ignore_tags or IGNORE_TAGS
         self.ignore_paths = ignore_paths or IGNORE_PATHS
+        self.bytes_read = 0
 
     def ingest(self) -> IngestResult:
         """Traverse the source directory and capture eligible files."""
         result = IngestResult()
+        self.bytes_read = 0
 
         if not self.source.exists():
             result.skipped.append((str(self.source), "missing_source"))
@@ -84,13 +87,15 @@ class OMAiIngestor:
                 result.skipped.append((str(path), "unsupported_extension"))
                 continue
 
-            if self._is_private(path):
+            if self._is_private_path(path):
                 result.skipped.append((str(path), "private_tagged"))
                 continue
 
+            # Read once; the privacy check and the record share the text.
+            # Undecodable or unreadable files are treated as private.
             content = self._read_text(path)
-            if content is None:
-                result.skipped.append((str(path), "unreadable"))
+            if content is None or self._is_private_content(content):
+                result.skipped.append((str(path), "private_tagged"))
                 continue
 
             result.records.append(
@@ -101,13 +106,14 @@ class OMAiIngestor:
                 }
             )
 
+        result.bytes_read = self.bytes_read
         return result
 
     def _is_supported(self, path: Path) -> bool:
         return path.suffix.lower() in self.extensions
 
-    def _is_private(self, path: Path) -> bool:
-        """Check if file should be skipped due to privacy markers."""
+    def _is_private_path(self, path: Path) -> bool:
+        """Privacy markers that need no file read."""
         # 1. Check path patterns (fastest check first)
         if self._looks_private_path(str(path)):
             return True
@@ -119,30 +125,24 @@ class OMAiIngestor:
         if tag in name_lower or tag_plain in name_lower:
             return True
 
-        # 3. Check file content for privacy markers
-        try:
-            content = path.read_text(encoding="utf-8")
-            
-            # Check frontmatter for private: true
-            if self._has_private_frontmatter(content):
-                return True
-            
-            # Check for privacy tags in content
-            content_lower = content.lower()
-            if tag in content_lower:
-                return True
-            
-            # Check for additional ignore tags
-            for ignore_tag in self.ignore_tags:
-                if f"#{ignore_tag}" in content_lower:
-                    return True
-                    
-        except UnicodeDecodeError:
-            # If a file cannot be decoded as UTF-8, treat it as private and skip.
+        return False
+
+    def _is_private_content(self, content: str) -> bool:
+        """Check already-loaded file content for privacy markers."""
+        # 3. Check frontmatter for private: true
+        if self._has_private_frontmatter(content):
             return True
-        except OSError:
+
+        # Check for privacy tags in content
+        content_lower = content.lower()
+        if self.ignore_tag in content_lower:
             return True
 
+        # Check for additional ignore tags
+        for ignore_tag in self.ignore_tags:
+            if f"#{ignore_tag}" in content_lower:
+                return True
+
         return False
     
     def _looks_private_path(self, path_str: str) -> bool:
@@ -188,12 +188,16 @@ class OMAiIngestor:
         return False
 
     def _read_text(self, path: Path) -> Optional[str]:
+        """Read a file as UTF-8 text (newlines normalized like read_text), counting bytes read."""
         try:
-            return path.read_text(encoding="utf-8")
-        except UnicodeDecodeError:
-            return None
+            data = path.read_bytes()
         except OSError:
             return None
+        self.bytes_read += len(data)
+        try:
+            return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        except UnicodeDecodeError:
+            return None
 
 
 def write_output(result: IngestResult, output_path: Path) -> None:
@@ -206,6 +210,24 @@ def write_output(result: IngestResult, output_path: Path) -> None:
     output_path.write_text(json.dumps(payload, indent=2), encoding="utf-8")
 
 
+def index_into_rag(result: IngestResult, batch_size: int = 2048) -> int:
+    """Add collected records to the RAG snippet store.
+
+    Records go in batches so their embeddings are encoded in bulk (on the
+    embedding worker pool for large batches, see RAG_EMBED_WORKERS).
+    """
+    from utils.rag import add_snippets
+
+    added = 0
+    for start in range(0, len(result.records), batch_size):
+        batch = result.records[start:start + batch_size]
+        added += len(add_snippets([
+            (record["content"], record["path"], {"full_path": record["full_path"], "origin": "omai_ingest"})
+            for record in batch
+        ]))
+    return added
+
+
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Ingest OMAi knowledge artifacts.")
     parser.add_argument(
@@ -231,6 +253,17 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="If set, do not write results to disk; just print summary counts.",
     )
+    parser.add_argument(
+        "--rag",
+        action="store_true",
+        help="Also add collected records to the RAG snippet store (bulk-encoded embeddings).",
+    )
+    parser.add_argument(
+        "--rag-batch",
+        type=int,
+        default=2048,
+        help="Records per RAG insert batch.",
+    )
     return parser.parse_args()
 
 
@@ -241,7 +274,11 @@ def main() -> None:
     ingestor = OMAiIngestor(args.source, extensions=extensions)
     result = ingestor.ingest()
 
-    print(f"[omai_ingest] collected={len(result.records)} skipped={len(result.skipped)}")
+    print(f"[omai_ingest] collected={len(result.records)} skipped={len(result.skipped)} bytes_read={result.bytes_read}")
+
+    if args.rag:
+        added = index_into_rag(result, batch_size=args.rag_batch)
+        print(f"[omai_ingest] added {added} records to the RAG store")
 
     if args.no_write:
         return
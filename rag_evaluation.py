@@ -3,15 +3,34 @@
 RAG Quality Evaluation Script
 Compares legacy vs enhanced RAG (BM25 + vector tie-break) performance
 Generates evaluation metrics and win-rate analysis
+
+--benchmark runs the retrieval benchmark instead: synthetic corpora of the
+given sizes, index build time, p50/p95/p99 query latency, peak RSS and
+recall@k against a brute-force BM25 oracle, written as diffable JSON
+(--no-timestamp leaves out the wall-clock run time).
 """
 
+import argparse
 import csv
+import heapq
 import json
+import math
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
 from pathlib import Path
-from typing import List, Dict, Any, Tuple
+from typing import Iterator, List, Dict, Any, Optional, Set, Tuple
 from utils.rag import (
     init_db, add_test_snippets, retrieve, retrieve_legacy,
-    reset_models, available as rag_available
+    reset_models, quantization_report, available as rag_available
 )
 
 def calculate_relevance_score(query: str, result: Dict[str, Any]) -> float:
@@ -184,8 +203,277 @@ def save_evaluation_json(results: List[Dict[str, Any]], metrics: Dict[str, Any],
 
     print(f"✅ Detailed evaluation saved to {filename}")
 
+def save_quantization_json(report: Dict[str, Any], filename: str = "data/ablation/rag_quantization.json") -> None:
+    """Save the float16/int8 vs float32 vector scoring comparison to JSON"""
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"✅ Quantization comparison saved to {filename}")
+
+# --- Retrieval benchmark ---------------------------------------------------
+
+BENCHMARK_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+BENCHMARK_VOCAB = 20_000
+BENCHMARK_INSERT_BATCH = 5_000
+
+_Snippet = Tuple[str, Optional[str], Optional[Dict[str, Any]]]  # (content, source, metadata), as rag.add_snippets() takes
+
+def _synthetic_vocab(size: int, seed: int) -> List[str]:
+    """Deterministic pronounceable pseudo-words (all survive the tokenizer)"""
+    rng = random.Random(seed)
+    onsets, vowels, codas = "bcdfghklmnprstvz", "aeiou", "lmnrstx"
+    vocab: List[str] = []
+    seen: Set[str] = set()
+    while len(vocab) < size:
+        word = "".join(rng.choice(onsets) + rng.choice(vowels) for _ in range(rng.randint(2, 4))) + rng.choice(codas)
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+def synthetic_corpus(size: int, seed: int = 0,
+                     batch_size: int = BENCHMARK_INSERT_BATCH) -> Iterator[List[_Snippet]]:
+    """Yield batches of (content, source, metadata) snippets with Zipfian term frequencies.
+
+    The same (size, seed) always produces the same corpus, so runs on
+    different commits index identical data.
+    """
+    vocab = _synthetic_vocab(BENCHMARK_VOCAB, seed)
+    cum_weights = []
+    total = 0.0
+    for rank in range(len(vocab)):
+        total += 1.0 / (rank + 1)
+        cum_weights.append(total)
+    rng = random.Random(seed + 1)
+    for start in range(0, size, batch_size):
+        batch: List[_Snippet] = []
+        for i in range(start, min(start + batch_size, size)):
+            words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(12, 48))
+            batch.append((" ".join(words), f"synthetic/doc_{i // 100}.md", None))
+        yield batch
+
+def synthetic_queries(count: int, seed: int = 0) -> List[str]:
+    """Queries of 2-4 mid-frequency terms from the synthetic vocabulary"""
+    vocab = _synthetic_vocab(BENCHMARK_VOCAB, seed)
+    rng = random.Random(seed + 2)
+    return [" ".join(rng.sample(vocab[50:5000], rng.randint(2, 4))) for _ in range(count)]
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile (pct in 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def _peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def bm25_oracle(conn: sqlite3.Connection, queries: List[str], k: int, k1: float = 1.2, b: float = 0.75) -> List[Dict[int, float]]:
+    """Exact BM25 score of every matching snippet, by two streaming passes over term_freqs.
+
+    Independent of the inverted index and its artifact; returns, per query,
+    {doc_id: score} for the snippets scoring at least the k-th best score
+    (ties included), which is what recall@k is measured against.
+    """
+    from utils.rag import _query_terms
+
+    query_terms = [_query_terms(query) for query in queries]
+    wanted = {term for terms in query_terms for term, _ in terms}
+    df: Dict[str, int] = defaultdict(int)
+    n_docs = total_len = 0
+    for (terms,) in conn.execute("SELECT terms FROM term_freqs"):
+        counts = json.loads(terms)
+        n_docs += 1
+        total_len += sum(counts.values())
+        for term in wanted.intersection(counts):
+            df[term] += 1
+    avgdl = total_len / n_docs if n_docs else 0.0
+    idf = {term: math.log(n_docs - df[term] + 0.5) - math.log(df[term] + 0.5) for term in wanted}
+
+    scores: List[Dict[int, float]] = [{} for _ in queries]
+    for doc_id, terms in conn.execute("SELECT id, terms FROM term_freqs"):
+        counts = json.loads(terms)
+        if wanted.isdisjoint(counts):
+            continue
+        norm = k1 * (1 - b + b * sum(counts.values()) / avgdl)
+        for q, qterms in enumerate(query_terms):
+            score = sum(qtf * idf[term] * counts[term] * (k1 + 1) / (counts[term] + norm)
+                        for term, qtf in qterms if term in counts)
+            if score > 0:
+                scores[q][doc_id] = score
+
+    relevant = []
+    for doc_scores in scores:
+        top = heapq.nlargest(k, doc_scores.values())
+        cutoff = top[-1] if top else float("inf")
+        relevant.append({doc_id: s for doc_id, s in doc_scores.items() if s >= cutoff - 1e-9})
+    return relevant
+
+def _tie_aware_recall(found: List[List[int]], relevant: List[Dict[int, float]], k: int) -> float:
+    """Fraction of the achievable top-k the index returned (ties with the k-th score all count)"""
+    total = 0.0
+    for ids, truth in zip(found, relevant):
+        expected = min(k, len(truth))
+        total += len(set(ids[:k]) & truth.keys()) / expected if expected else 1.0
+    return round(total / len(found), 4) if found else 1.0
+
+def benchmark_size(size: int, modes: List[str], query_count: int = 200, top_k: int = 10,
+                   oracle_queries: int = 50, seed: int = 0) -> Dict[str, Any]:
+    """Benchmark one corpus size in a fresh temporary DB (meant to run in its own process)"""
+    import utils.rag as rag
+
+    with tempfile.TemporaryDirectory(prefix="rag_bench_") as tmp:
+        rag.EMBEDDINGS_DB = Path(tmp) / "bench.sqlite"
+        rag.RAG_SHARDS = 1
+        rag.RAG_BACKGROUND_REBUILD = False
+        rag.reset_models()
+
+        started = time.perf_counter()
+        for batch in synthetic_corpus(size, seed):
+            rag.add_snippets(batch)
+        ingest_seconds = time.perf_counter() - started
+
+        rag.reset_models()
+        started = time.perf_counter()
+        rag._ensure_models()
+        build_seconds = time.perf_counter() - started
+
+        rag.reset_models()
+        started = time.perf_counter()
+        rag._ensure_models()
+        load_seconds = time.perf_counter() - started
+
+        queries = synthetic_queries(query_count, seed)
+        oracle = bm25_oracle(rag._connect(), queries[:oracle_queries], top_k)
+        result: Dict[str, Any] = {
+            "size": size,
+            "top_k": top_k,
+            "queries": len(queries),
+            "ingest_seconds": round(ingest_seconds, 3),
+            "build_seconds": round(build_seconds, 3),
+            "load_seconds": round(load_seconds, 3),
+            "modes": {},
+        }
+        for mode in modes:
+            latencies, found = [], []
+            for query in queries:
+                rag.clear_cache()  # time retrieval, not the result cache
+                started = time.perf_counter()
+                results = rag.retrieve(query, top_k=top_k, mode=mode)
+                latencies.append((time.perf_counter() - started) * 1000)
+                found.append([r["id"] for r in results])
+            methods = sorted({r["rank_method"] for r in results}) if results else []
+            stats: Dict[str, Any] = {
+                "rank_methods": methods,
+                "latency_ms": {
+                    "p50": round(percentile(latencies, 50), 3),
+                    "p95": round(percentile(latencies, 95), 3),
+                    "p99": round(percentile(latencies, 99), 3),
+                    "mean": round(sum(latencies) / len(latencies), 3),
+                },
+            }
+            if mode == "bm25":
+                stats["recall_at_k"] = _tie_aware_recall(found[:oracle_queries], oracle, top_k)
+            else:
+                stats["ann_recall_at_k"] = rag.ann_recall(queries[:oracle_queries], top_k)
+            result["modes"][mode] = stats
+        result["peak_rss_mb"] = _peak_rss_mb()
+        rag.reset_models()
+    return result
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def run_benchmark(sizes: List[int], modes: List[str], query_count: int = 200, top_k: int = 10,
+                  oracle_queries: int = 50, seed: int = 0, timestamp: bool = True) -> Dict[str, Any]:
+    """Benchmark every corpus size in its own process so peak RSS is per size.
+
+    timestamp=False leaves the run time out of the report, so reports from
+    different runs only differ in their measurements.
+    """
+    import utils.rag as rag
+
+    print("⏱️  Running RAG Retrieval Benchmark")
+    print("=" * 50)
+    results = []
+    for size in sizes:
+        print(f"Corpus size {size:,}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            result = pool.submit(benchmark_size, size, modes, query_count, top_k, oracle_queries, seed).result()
+        for mode, stats in result["modes"].items():
+            latency = stats["latency_ms"]
+            recall = stats.get("recall_at_k", stats.get("ann_recall_at_k"))
+            print(f"  ✓ {mode}: build {result['build_seconds']}s, "
+                  f"p50 {latency['p50']}ms, p95 {latency['p95']}ms, p99 {latency['p99']}ms, "
+                  f"recall@{top_k} {recall}, peak RSS {result['peak_rss_mb']} MB")
+        results.append(result)
+
+    report = {
+        "benchmark": "rag_retrieval",
+        "git_commit": _git_commit(),
+        "config": {
+            "seed": seed,
+            "vocab": BENCHMARK_VOCAB,
+            "oracle_queries": oracle_queries,
+            "vector_available": rag.VECTOR_AVAILABLE,
+            "vector_dtype": rag.RAG_VECTOR_DTYPE,
+            "backend": rag.RAG_BACKEND,
+            "stemmer": rag.RAG_STEMMER,
+            "stopwords": rag.RAG_STOPWORDS,
+            "ann_min_rows": rag.RAG_ANN_MIN_ROWS,
+            "ann_nprobe": rag.RAG_ANN_NPROBE,
+        },
+        "results": results,
+    }
+    if timestamp:
+        report["timestamp"] = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return report
+
+def save_benchmark_json(report: Dict[str, Any], filename: str = "data/ablation/rag_benchmark.json") -> None:
+    """Save benchmark results to JSON (sorted keys, so runs diff cleanly)"""
+    Path(filename).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print(f"✅ Benchmark results saved to {filename}")
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="RAG quality evaluation and retrieval benchmark")
+    parser.add_argument("--benchmark", action="store_true", help="Run the synthetic-corpus retrieval benchmark")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in BENCHMARK_SIZES[:2]),
+                        help="Comma-separated corpus sizes (e.g. 1000,10000,100000,1000000)")
+    parser.add_argument("--modes", default="bm25", help="Comma-separated retrieval modes (bm25,vector,hybrid)")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per size and mode")
+    parser.add_argument("--oracle-queries", type=int, default=50, help="Queries checked against the brute-force oracle")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="data/ablation/rag_benchmark.json")
+    parser.add_argument("--no-timestamp", action="store_true",
+                        help="Leave the wall-clock timestamp out of the benchmark JSON")
+    return parser.parse_args(argv)
+
 def main():
     """Main evaluation entry point"""
+    args = parse_args()
+    if args.benchmark:
+        report = run_benchmark(
+            [int(size) for size in args.sizes.split(",") if size],
+            [mode.strip() for mode in args.modes.split(",") if mode.strip()],
+            query_count=args.queries, top_k=args.top_k,
+            oracle_queries=args.oracle_queries, seed=args.seed, timestamp=not args.no_timestamp,
+        )
+        save_benchmark_json(report, args.output)
+        return
+
     # Test queries for evaluation
     evaluation_queries = [
         "How does agent routing work in the system?",
@@ -219,6 +507,21 @@ def main():
     save_evaluation_csv(results, metrics)
     save_evaluation_json(results, metrics)
 
+    # Accuracy cost of quantized embedding storage on the same queries
+    quantization = quantization_report(evaluation_queries, k=3)
+    if quantization:
+        print("\n📐 Quantized Vector Scoring vs float32")
+        print("-" * 30)
+        for dtype in ("float16", "int8"):
+            stats = quantization[dtype]
+            print(f"{dtype}: recall@3 {stats['recall_at_k']}, "
+                  f"mean |Δcos| {stats['mean_abs_error']:.5f}, "
+                  f"{stats['bytes_per_row']:.0f} B/row "
+                  f"(float32: {quantization['baseline']['bytes_per_row']} B/row)")
+        save_quantization_json(quantization)
+    else:
+        print("\nℹ️  Vector model not loaded - skipping quantization comparison")
+
     print("\n🎉 RAG Quality Evaluation Complete!")
 
 if __name__ == "__main__":
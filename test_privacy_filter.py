@@ -54,6 +54,10 @@ This is public content.""")
         assert "tagged.md" in skipped_dict, "Should skip #private tag"
         assert "secret.md" in skipped_dict, "Should skip _private/ path"
         assert "_draft.md" in skipped_dict, "Should skip _ prefix"
+
+        # Each content-checked file is read exactly once; files private by path or name not at all
+        read_once = sum((vault / name).stat().st_size for name in ["tagged.md", "public.md"])
+        assert result.bytes_read == read_once, f"Expected {read_once} bytes read, got {result.bytes_read}"
         
         print("\n🎉 All privacy filter tests passed!")
         print("\nSkipped items:")
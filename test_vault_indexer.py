@@ -10,7 +10,6 @@ Verifies all acceptance criteria:
 
 import json
 import sys
-from pathlib import Path
 
 def test_index_structure():
     """Test that index has required sections[], tables[], and weight fields."""
@@ -204,6 +203,230 @@ def test_query_ranking():
     else:
         print("! No documents matched query terms")
 
+def _write_vault(root):
+    """Small vault with duplicates, private notes and unsupported files"""
+    for i in range(24):
+        (root / f"note_{i:02d}.md").write_text(f"# Note {i}\n\n## Body\n\nContent number {i}. #alpha #beta #tag{i}\n")
+    (root / "copy_of_note_03.md").write_text("# Note 3\n\n## Body\n\nContent number 3. #alpha #beta #tag3\n")
+    (root / "secret.md").write_text("# Secret\n\n#private\n")
+    (root / "image.png").write_bytes(b"\x89PNG")
+    (root / "logs").mkdir()
+    (root / "logs" / "training-log.md").write_text("# Training log\n\n| a | b |\n|---|---|\n| 1 | 2 |\n")
+
+def test_parallel_indexing_deterministic(tmp_path):
+    """Worker count must not change the index"""
+    print("🧪 Testing parallel indexing determinism...")
+    from vault_indexer import EnhancedVaultIndexer
+
+    _write_vault(tmp_path)
+
+    def snapshot(workers):
+        index = EnhancedVaultIndexer(tmp_path).index_vault(workers=workers, chunk_size=4)
+        return index.documents, index.duplicates, index.skipped, index.metadata["bytes_read"]
+
+    serial = snapshot(1)
+    assert serial == snapshot(3), "Parallel index differs from serial index"
+    assert len(serial[0]) == 25, f"Expected 25 documents, got {len(serial[0])}"
+    assert len(serial[1]) == 1, "Duplicate should be detected across chunks"
+    assert {reason for _, reason in serial[2]} == {"unsupported_extension", "private_tagged"}
+    # Every file not private by name is read once (the privacy check reuses the parsed text)
+    assert serial[3] == sum(p.stat().st_size for p in tmp_path.rglob("*.md") if p.name != "secret.md")
+    print("✅ Parallel indexing matches serial indexing")
+
+def test_worker_pool_per_run(tmp_path, monkeypatch):
+    """Both parse passes of an incremental run share one worker pool"""
+    print("🧪 Testing one worker pool per indexing run...")
+    import os
+    from vault_indexer import EnhancedVaultIndexer
+
+    for i in range(6):
+        (tmp_path / f"copy_{i}.md").write_text(f"# Note {i}\n\nBody {i}.\n")
+        (tmp_path / f"note_{i}.md").write_text(f"# Note {i}\n\nBody {i}.\n")  # duplicate of copy_{i}
+    indexer = EnhancedVaultIndexer(tmp_path)
+    previous = indexer.index_vault(workers=1)
+
+    # Three changed files for the first pass, three former duplicates for the second
+    for i in range(3):
+        (tmp_path / f"copy_{i}.md").unlink()
+        (tmp_path / f"note_{i + 3}.md").write_text(f"# Note {i + 3}\n\nEdited.\n")
+        os.utime(tmp_path / f"note_{i + 3}.md", ns=(1, 1))
+
+    pools = []
+    worker_pool = EnhancedVaultIndexer._worker_pool
+    monkeypatch.setattr(EnhancedVaultIndexer, "_worker_pool",
+                        lambda self, workers: pools.append(workers) or worker_pool(self, workers))
+    incremental = EnhancedVaultIndexer(tmp_path).index_vault(
+        workers=3, chunk_size=2, previous=previous, manifest=indexer.manifest
+    )
+    assert pools == [3], f"Expected one pool for the run, got {len(pools)}"
+    assert incremental.metadata["files_reprocessed"] == 6
+    assert incremental.documents == EnhancedVaultIndexer(tmp_path).index_vault(workers=1).documents
+    print("✅ Incremental run reuses one worker pool")
+
+def test_incremental_indexing(tmp_path):
+    """An incremental run re-reads only changed files and matches a full run"""
+    print("🧪 Testing incremental indexing...")
+    import os
+    from vault_indexer import EnhancedVaultIndexer, load_index, write_index
+
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    _write_vault(vault)
+
+    indexer = EnhancedVaultIndexer(vault)
+    write_index(indexer.index_vault(workers=1), tmp_path / "index.json")
+    previous, manifest = load_index(tmp_path / "index.json"), indexer.manifest
+
+    unchanged = EnhancedVaultIndexer(vault).index_vault(workers=1, previous=previous, manifest=manifest)
+    assert unchanged.metadata["files_reprocessed"] == 0, "Unchanged vault should not be re-read"
+    assert unchanged.metadata["bytes_read"] == 0
+
+    # Edit one note, delete the original of a duplicate, add a note
+    (vault / "note_05.md").write_text("# Note 5\n\nRewritten.\n")
+    os.utime(vault / "note_05.md", ns=(1, 1))
+    (vault / "copy_of_note_03.md").unlink()
+    (vault / "new_note.md").write_text("# New note\n\nFresh.\n")
+
+    incremental = EnhancedVaultIndexer(vault).index_vault(workers=1, previous=previous, manifest=manifest)
+    full = EnhancedVaultIndexer(vault).index_vault(workers=1)
+
+    assert incremental.metadata["incremental"] is True
+    # note_05 and new_note changed; note_03 is no longer a duplicate
+    assert incremental.metadata["files_reprocessed"] == 3
+    assert incremental.documents == full.documents, "Incremental documents differ from a full run"
+    assert incremental.duplicates == full.duplicates == []
+    assert incremental.skipped == full.skipped
+    print("✅ Incremental index matches a full rebuild")
+
+def test_patch_index(tmp_path):
+    """An incremental run patches a stored index of any format to match a full run"""
+    print("🧪 Testing incremental index patching...")
+    import os
+    from vault_indexer import EnhancedVaultIndexer, load_index, patch_index, read_document_paths, write_index
+
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    _write_vault(vault)
+    indexer = EnhancedVaultIndexer(vault)
+    index, manifest = indexer.index_vault(workers=1), indexer.manifest
+    for name in ["index.json", "index.jsonl", "index.sqlite"]:
+        write_index(index, tmp_path / name)
+
+    (vault / "note_05.md").write_text("# Note 5\n\nRewritten.\n")
+    os.utime(vault / "note_05.md", ns=(1, 1))
+    (vault / "note_08.md").unlink()
+    (vault / "copy_of_note_03.md").unlink()
+    (vault / "new_note.md").write_text("# New note\n\nFresh.\n")
+    full = EnhancedVaultIndexer(vault).index_vault(workers=1)
+
+    for name in ["index.json", "index.jsonl", "index.sqlite"]:
+        previous_paths = read_document_paths(tmp_path / name)
+        assert previous_paths == [doc.path for doc in index.documents]
+        patch = EnhancedVaultIndexer(vault).index_changes(workers=1, previous_paths=previous_paths, manifest=manifest)
+        assert sorted(patch.documents) == ["new_note.md", "note_03.md", "note_05.md"]
+        assert patch.removed == ["copy_of_note_03.md", "note_08.md"]
+
+        inode = (tmp_path / name).stat().st_ino
+        patch_index(patch, tmp_path / name)
+        if name.endswith(".sqlite"):
+            assert (tmp_path / name).stat().st_ino == inode, "SQLite index was rebuilt instead of patched"
+        patched = load_index(tmp_path / name)
+        assert patched.documents == full.documents, f"Patched {name} differs from a full run"
+        assert patched.duplicates == full.duplicates and patched.skipped == full.skipped
+        assert patched.metadata == patch.metadata
+    print("✅ Patched indexes match a full rebuild")
+
+def test_index_formats_roundtrip(tmp_path):
+    """JSONL and SQLite indexes hold the same index and export to the legacy JSON"""
+    print("🧪 Testing JSONL / SQLite index formats...")
+    from vault_indexer import (
+        EnhancedVaultIndexer, export_json, iter_documents, load_index, read_metadata, write_index
+    )
+
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    _write_vault(vault)
+    index = EnhancedVaultIndexer(vault).index_vault(workers=1)
+    write_index(index, tmp_path / "index.json")
+
+    for name in ["index.jsonl", "index.sqlite"]:
+        write_index(index, tmp_path / name)
+        loaded = load_index(tmp_path / name)
+        assert loaded == index, f"{name} does not round-trip"
+        assert read_metadata(tmp_path / name) == index.metadata
+
+        headers = list(iter_documents(tmp_path / name))
+        assert [h["path"] for h in headers] == [d.path for d in index.documents]
+        assert all("content" not in h and "sections" not in h for h in headers), "Bodies loaded for metadata"
+
+        export_json(tmp_path / name, tmp_path / f"{name}.json")
+        assert (tmp_path / f"{name}.json").read_text() == (tmp_path / "index.json").read_text()
+
+    # A failed write leaves the old index in place and no temp files behind
+    from vault_indexer import _replace_atomically
+
+    def failing_write(tmp):
+        tmp.write_text("partial")
+        raise RuntimeError("write failed")
+
+    before = (tmp_path / "index.json").read_text()
+    try:
+        _replace_atomically(tmp_path / "index.json", failing_write)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("Write error was swallowed")
+    assert (tmp_path / "index.json").read_text() == before
+    assert not list(tmp_path.glob("*.tmp")), "Temp files left behind"
+    print("✅ JSONL and SQLite indexes round-trip and export to JSON")
+
+def test_watch_mode(tmp_path):
+    """Watch mode picks up new, renamed and deleted notes without full rescans"""
+    print("🧪 Testing vault watch mode...")
+    import threading
+    import time
+    from vault_indexer import EnhancedVaultIndexer, VaultWatcher, load_index
+
+    vault = tmp_path / "vault"
+    vault.mkdir()
+    _write_vault(vault)
+    output = tmp_path / "index.sqlite"
+
+    watcher = VaultWatcher(EnhancedVaultIndexer(vault), output, interval=0.02, debounce=0.05,
+                           rescan=0, workers=1, polling=True)
+    thread = threading.Thread(target=watcher.run, daemon=True)
+    thread.start()
+
+    def wait_for(predicate):
+        deadline = time.time() + 10
+        while time.time() < deadline:
+            index = load_index(output)
+            if index is not None and predicate(index):
+                return index
+            time.sleep(0.02)
+        raise AssertionError("Watcher did not update the index in time")
+
+    try:
+        wait_for(lambda index: len(index.documents) == 25)
+        inode = output.stat().st_ino
+
+        (vault / "logs" / "fresh.md").write_text("# Fresh note\n\nJust written.\n")
+        index = wait_for(lambda index: "logs/fresh.md" in [d.path for d in index.documents])
+        assert index.metadata["incremental"] and index.metadata["files_reprocessed"] == 1
+
+        (vault / "note_07.md").rename(vault / "renamed.md")
+        (vault / "note_08.md").unlink()
+        index = wait_for(lambda index: "note_08.md" not in [d.path for d in index.documents])
+        assert output.stat().st_ino == inode, "Watcher rewrote the index instead of patching it"
+    finally:
+        watcher.stop()
+        thread.join(timeout=5)
+
+    full = EnhancedVaultIndexer(vault).index_vault(workers=1)
+    assert index.documents == full.documents, "Watched index differs from a full run"
+    assert index.duplicates == full.duplicates and index.skipped == full.skipped
+    print("✅ Watch mode keeps the index current")
+
 def main():
     """Run all tests."""
     print("Running Enhanced OMAi Vault Indexer Tests\n")
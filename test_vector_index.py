@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Test the NumPy IVF index used for semantic-first RAG retrieval"""
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.vector_index import IVFIndex, QuantizedMatrix, recall_at_k  # noqa: E402
+
+def _clustered(n=4000, dim=32, clusters=40, seed=7):
+    """Unit vectors scattered around random cluster centres"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dim))
+    points = centres[rng.integers(0, clusters, size=n)] + 0.3 * rng.normal(size=(n, dim))
+    points /= np.linalg.norm(points, axis=1, keepdims=True)
+    return points.astype(np.float32), rng
+
+def _exact(matrix, query, k):
+    return list(np.argsort(-(matrix @ query), kind="stable")[:k])
+
+def test_ivf_recall_against_brute_force():
+    """IVF top-k recall stays high while scanning a fraction of the rows"""
+    print("Testing IVF recall@10...")
+    matrix, rng = _clustered()
+    index = IVFIndex.build(matrix)
+    assert index.nlist == int(np.sqrt(len(matrix)))
+
+    queries = matrix[rng.choice(len(matrix), size=50, replace=False)]
+    approx, exact, scanned = [], [], []
+    for query in queries:
+        rows, scores = index.search(matrix, query, k=10, nprobe=8)
+        assert list(scores) == sorted(scores, reverse=True)
+        approx.append(list(rows))
+        exact.append(_exact(matrix, query, 10))
+        scanned.append(len(index.candidate_rows(query, nprobe=8)))
+
+    recall = recall_at_k(approx, exact)
+    print(f"✓ recall@10 = {recall:.3f}, mean rows scanned = {np.mean(scanned):.0f}/{len(matrix)}")
+    assert recall >= 0.9
+    assert np.mean(scanned) < len(matrix) / 3
+
+def test_ivf_add_and_persist(tmp_path):
+    """Rows added after build are searchable and survive save/load"""
+    matrix, _ = _clustered(n=500)
+    index = IVFIndex.build(matrix[:400], nlist=10)
+    for row in range(400, 500):
+        index.add(row, matrix[row])
+
+    rows, _ = index.search(matrix, matrix[450], k=1, nprobe=10)
+    assert list(rows) == [450]
+
+    loaded = IVFIndex.load(tmp_path, index.save(tmp_path, "1-1"))
+    assert sorted(loaded.order) == list(range(500))
+    for query_row in (3, 450):
+        assert list(loaded.search(matrix, matrix[query_row], k=5, nprobe=10)[0]) == \
+            list(index.search(matrix, matrix[query_row], k=5, nprobe=10)[0])
+
+if __name__ == "__main__":
+    test_ivf_recall_against_brute_force()
+
+def test_quantized_scoring():
+    """int8/float16 codes score close to float32 at a fraction of the memory"""
+    print("Testing quantized scoring...")
+    matrix, rng = _clustered(n=2000)
+    queries = matrix[rng.choice(len(matrix), size=30, replace=False)]
+    for dtype, max_error in (("float16", 1e-3), ("int8", 0.03)):
+        packed = QuantizedMatrix.from_float(matrix, dtype)
+        assert packed.nbytes < matrix.nbytes / (1.9 if dtype == "float16" else 3.5)
+        approx, exact = [], []
+        for query in queries:
+            scores = packed.dot(query, chunk_size=512)
+            assert np.abs(scores - matrix @ query).max() < max_error
+            approx.append(list(np.argsort(-scores, kind="stable")[:10]))
+            exact.append(_exact(matrix, query, 10))
+        recall = recall_at_k(approx, exact)
+        print(f"  {dtype}: recall@10 {recall:.3f}, {packed.nbytes / len(packed):.0f} B/row")
+        assert recall >= 0.9
+
+    # The IVF index trains and searches on a quantized matrix directly
+    packed = QuantizedMatrix.from_float(matrix, "int8")
+    index = IVFIndex.build(packed)
+    rows, _ = index.search(packed, queries[0], k=10, nprobe=8)
+    assert len(set(rows) & set(_exact(matrix, queries[0], 10))) >= 8
+
+    grown = packed.resized(len(packed) + 1)
+    grown[len(packed)] = matrix[0]
+    assert np.array_equal(grown.codes[len(packed)], packed.codes[0])
+    assert np.array_equal(grown.head(len(packed)).codes, packed.codes)
@@ -0,0 +1,91 @@
+# utils/embedding_pool.py
+"""
+Multi-process embedding service for Spiral Codex RAG
+A pool of worker processes, each loading the sentence transformer once, that
+encodes batches of texts in parallel and returns float32 arrays. Used for bulk
+encodes (backfills, fits, ingest); queries stay on the in-process model.
+"""
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, List, Optional
+
+import numpy as np
+
+_worker_model: Any = None  # the model inside a worker process
+
+def _init_worker(loader: Optional[Callable[[str], Any]], model_name: str, threads: int) -> None:
+    """Load the model once per worker, splitting the cores between workers"""
+    global _worker_model
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    if loader is None:
+        from sentence_transformers import SentenceTransformer
+        loader = SentenceTransformer
+    _worker_model = loader(model_name)
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    assert _worker_model is not None, "embedding worker was not initialized"
+    return np.asarray(_worker_model.encode(texts, show_progress_bar=False), dtype=np.float32)
+
+class EmbeddingPool:
+    """Encode texts across worker processes, batch_size texts per task.
+
+    Results come back in input order as one (n, dim) float32 array. loader
+    (a picklable callable, default SentenceTransformer) builds the model from
+    model_name inside each worker.
+    """
+
+    def __init__(self, model_name: str, workers: int, batch_size: int = 256,
+                 loader: Optional[Callable[[str], Any]] = None) -> None:
+        self.model_name = model_name
+        self.loader = loader
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        threads = max(1, (os.cpu_count() or 1) // self.workers)
+        # spawn: a forked torch runtime can deadlock in the child
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=get_context("spawn"),
+            initializer=_init_worker, initargs=(loader, model_name, threads),
+        )
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        batches = [texts[start:start + self.batch_size] for start in range(0, len(texts), self.batch_size)]
+        return np.concatenate(list(self._executor.map(_encode_batch, batches)))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+_pool: Optional[EmbeddingPool] = None
+_pool_lock = threading.Lock()
+
+def get_pool(model_name: str, workers: int, batch_size: int,
+             loader: Optional[Callable[[str], Any]] = None) -> EmbeddingPool:
+    """Shared pool for these settings (workers start on the first encode)"""
+    global _pool
+    settings = (model_name, max(1, workers), max(1, batch_size), loader)
+    with _pool_lock:
+        if _pool is None or (_pool.model_name, _pool.workers, _pool.batch_size, _pool.loader) != settings:
+            if _pool is not None:
+                _pool.close()
+            _pool = EmbeddingPool(model_name, workers, batch_size, loader)
+        return _pool
+
+def shutdown_pool() -> None:
+    """Stop the shared pool's workers (it is recreated on the next get_pool())"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+atexit.register(shutdown_pool)
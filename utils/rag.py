@@ -3,128 +3,871 @@
 Enhanced RAG (Retrieval-Augmented Generation) for Spiral Codex
 Uses BM25 + vector tie-break scoring for improved retrieval quality
 """
+import asyncio
+import gc
 import os
 import sqlite3
+import sys
+import threading
+from array import array
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple, Union
+import heapq
+import itertools
+from functools import lru_cache
+import copy
 import json
 import math
+import mmap
 import re
-from collections import Counter, defaultdict
+import time
+import uuid
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 EMBEDDINGS_DB = Path(os.getenv("EMBEDDINGS_DB", "data/embeddings.sqlite"))
 BM25_TOP_K = int(os.getenv("BM25_TOP_K", "5"))
+BM25_TIE_FACTOR = int(os.getenv("BM25_TIE_FACTOR", "4"))  # hits kept with ties, as a multiple of top_k
 VECTOR_MODEL = os.getenv("VECTOR_MODEL", "all-MiniLM-L6-v2")
+VECTOR_BACKFILL_BATCH = int(os.getenv("VECTOR_BACKFILL_BATCH", "64"))
+RAG_COMPACT_EVERY = int(os.getenv("RAG_COMPACT_EVERY", "500"))
+RAG_BACKEND = os.getenv("RAG_BACKEND", "memory").lower()  # memory | fts5
+FTS5_CANDIDATE_FACTOR = int(os.getenv("FTS5_CANDIDATE_FACTOR", "4"))
+RAG_ANN_MIN_ROWS = int(os.getenv("RAG_ANN_MIN_ROWS", "2000"))  # below this, exact search
+RAG_ANN_NLIST = int(os.getenv("RAG_ANN_NLIST", "0"))  # 0 = sqrt(rows)
+RAG_ANN_NPROBE = int(os.getenv("RAG_ANN_NPROBE", "8"))
+RAG_VECTOR_DTYPE = os.getenv("RAG_VECTOR_DTYPE", "float32").lower()  # float32 | float16 | int8
+RAG_HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "50"))  # top-N per ranker
+RRF_K = int(os.getenv("RRF_K", "60"))
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "256"))  # 0 disables the result cache
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "300"))  # seconds
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "30"))  # seconds a writer waits for the lock
+SQLITE_CACHED_STATEMENTS = int(os.getenv("SQLITE_CACHED_STATEMENTS", "256"))  # prepared statements per connection
+RAG_EXECUTOR_WORKERS = int(os.getenv("RAG_EXECUTOR_WORKERS", "4"))  # threads serving aretrieve()
+RAG_MAX_CONCURRENT_ENCODES = int(os.getenv("RAG_MAX_CONCURRENT_ENCODES", "2"))  # transformer calls at once
+RAG_STOPWORDS = os.getenv("RAG_STOPWORDS", "0") not in ("0", "false", "False")  # drop English stopwords
+RAG_STEMMER = os.getenv("RAG_STEMMER", "none").lower()  # none | light | porter (needs nltk)
+RAG_BACKGROUND_REBUILD = os.getenv("RAG_BACKGROUND_REBUILD", "1") not in ("0", "false", "False")
+RAG_REBUILD_RETRY = float(os.getenv("RAG_REBUILD_RETRY", "30"))  # seconds before retrying a failed rebuild
+RAG_SHARDS = int(os.getenv("RAG_SHARDS", "1"))  # >1 partitions snippets over per-process shards
+RAG_SHARD_KEY = os.getenv("RAG_SHARD_KEY", "hash").lower()  # hash (content) | source
+RAG_EMBED_WORKERS = int(os.getenv("RAG_EMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))  # 0 = in-process
+RAG_EMBED_BATCH = int(os.getenv("RAG_EMBED_BATCH", "256"))  # texts per worker task
+RAG_EMBED_POOL_MIN = int(os.getenv("RAG_EMBED_POOL_MIN", "512"))  # smaller encodes stay in-process
+INDEX_FORMAT_VERSION = 3
+RESULT_CONTENT_CHARS = 500  # content is truncated to this in SQL before it reaches Python
+SCHEMA_VERSION = 3  # PRAGMA user_version once _migrate() has run
 
 # Try to import vector model, but make it optional
 try:
-    from sentence_transformers import SentenceTransformer
     import numpy as np
-    VECTOR_AVAILABLE = True
+    from utils.vector_index import IVFIndex, QuantizedMatrix, STORAGE_DTYPES, inner_products, recall_at_k
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from sentence_transformers import SentenceTransformer
+    VECTOR_AVAILABLE = NUMPY_AVAILABLE
 except ImportError:
     VECTOR_AVAILABLE = False
 
+if TYPE_CHECKING:
+    from utils.rag_shards import ShardedStore
+
+_connections = threading.local()  # per-thread {db path: (conn, pid, st_dev, st_ino)}
+
+def _connect() -> sqlite3.Connection:
+    """This thread's long-lived connection to EMBEDDINGS_DB.
+
+    Connections run in WAL mode, so readers never wait on an ingest write,
+    and keep SQLITE_CACHED_STATEMENTS prepared statements across calls. A
+    connection is reopened if the DB file was replaced or after a fork.
+    """
+    path = str(EMBEDDINGS_DB)
+    pool = getattr(_connections, "pool", None)
+    if pool is None:
+        pool = _connections.pool = {}
+    try:
+        st = os.stat(path)
+        identity = (os.getpid(), st.st_dev, st.st_ino)
+    except FileNotFoundError:
+        identity = None
+    cached = pool.get(path)
+    if cached is not None and identity is not None and cached[1:] == identity:
+        return cached[0]
+    if cached is not None:
+        cached[0].close()
+
+    EMBEDDINGS_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=SQLITE_BUSY_TIMEOUT, cached_statements=SQLITE_CACHED_STATEMENTS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; WAL keeps the DB consistent
+    _migrate(conn)
+    st = os.stat(path)
+    pool[path] = (conn, os.getpid(), st.st_dev, st.st_ino)
+    return conn
+
+def close_connections() -> None:
+    """Close the calling thread's pooled connections"""
+    pool = getattr(_connections, "pool", None) or {}
+    for conn, *_ in pool.values():
+        conn.close()
+    pool.clear()
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    """Bring the schema up to SCHEMA_VERSION (idempotent, one writer at a time)"""
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    content TEXT NOT NULL,
+                    source TEXT,
+                    metadata TEXT,
+                    vector_embedding BLOB,  -- Store as BLOB for efficiency
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Create indexes for faster search
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_content ON embeddings(content)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_source ON embeddings(source)")
+
+            # Corpus generation counter, bumped on every write to the snippet table
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rag_meta (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
+                )
+            """)
+            conn.execute("INSERT OR IGNORE INTO rag_meta (key, value) VALUES ('generation', 0)")
+        if version < 2:
+            # Pre-tokenized {term: tf} per snippet, filled at insert so BM25
+            # fits never re-read content; rows go stale with their snippet
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS term_freqs (
+                    id INTEGER PRIMARY KEY,  -- embeddings.id
+                    terms TEXT NOT NULL  -- JSON {term: tf} after the tokenizer pipeline
+                )
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS term_freqs_ad AFTER DELETE ON embeddings BEGIN
+                    DELETE FROM term_freqs WHERE id = old.id;
+                END
+            """)
+            conn.execute("""
+                CREATE TRIGGER IF NOT EXISTS term_freqs_au AFTER UPDATE OF content ON embeddings BEGIN
+                    DELETE FROM term_freqs WHERE id = old.id;
+                END
+            """)
+        if version < 3:
+            # Every row written to the snippet table bumps the generation, so
+            # direct writes by other tools invalidate caches and indexes too.
+            # Embedding backfills (vector_embedding only) leave it alone.
+            for name, event in (("generation_ai", "INSERT"), ("generation_ad", "DELETE"),
+                                ("generation_au", "UPDATE OF content, source, metadata")):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON embeddings BEGIN
+                        UPDATE rag_meta SET value = value + 1 WHERE key = 'generation';
+                    END
+                """)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _index_dir() -> Path:
+    """Directory holding the persisted index artifact (next to the DB)"""
+    override = os.getenv("RAG_INDEX_DIR")
+    return Path(override) if override else EMBEDDINGS_DB.with_suffix(".index")
+
+def _write_new_file(path: Path, write: Callable[[Any], object]) -> None:
+    """Write a fresh file via write(f) on a unique temp name, then rename it into place.
+
+    The target name may belong to a file some index still has mapped; it is
+    replaced, never truncated, so that mapping keeps its old contents.
+    """
+    tmp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def _map_int32(path: Path) -> memoryview:
+    """Memory-map a packed native int32 file as a read-only memoryview"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(array("i"))
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast("i")
+
+_TOKEN_RE = re.compile(r'\b\w+\b')
+
+def _tokenize(text: str) -> List[str]:
+    """Simple tokenization"""
+    # Convert to lowercase and extract alphanumeric tokens
+    return [t for t in _TOKEN_RE.findall(text.lower()) if len(t) > 2]  # Filter very short tokens
+
+STOPWORDS = frozenset("""
+    about above after again against all and any are because been before being below between both
+    but can could did does doing down during each few for from further had has have having her here
+    hers herself him himself his how into its itself just more most not now off once only other our
+    ours ourselves out over own same she should some such than that the their theirs them themselves
+    then there these they this those through too under until very was were what when where which
+    while who whom why will with would you your yours yourself yourselves
+""".split())
+
+_LIGHT_SUFFIXES = (("ies", "y"), ("sses", "ss"), ("ing", ""), ("ed", ""), ("s", ""))
+
+@lru_cache(maxsize=65536)
+def _light_stem(word: str) -> str:
+    """Strip one common inflection, then a trailing e (route/routes/routed/routing -> rout)"""
+    if not word.endswith("ss"):
+        for suffix, replacement in _LIGHT_SUFFIXES:
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+                word = word[:-len(suffix)] + replacement
+                break
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    return word
+
+_pipelines: Dict[Tuple[bool, str], Tuple[str, Optional[frozenset], Any]] = {}
+
+def _pipeline() -> Tuple[str, Optional[frozenset], Any]:
+    """(signature, stopwords, stem function) for the configured tokenizer pipeline"""
+    key = (RAG_STOPWORDS, RAG_STEMMER)
+    if key not in _pipelines:
+        stemmer, stem = RAG_STEMMER, None
+        if stemmer == "porter":
+            try:
+                from nltk.stem import PorterStemmer
+                stem = lru_cache(maxsize=65536)(PorterStemmer().stem)
+            except ImportError:
+                print("[RAG] Warning: RAG_STEMMER=porter needs nltk, using the light stemmer")
+                stemmer = "light"
+        if stemmer == "light":
+            stem = _light_stem
+        elif stem is None:
+            stemmer = "none"
+        signature = f"v1|stopwords={int(RAG_STOPWORDS)}|stem={stemmer}"
+        _pipelines[key] = (signature, STOPWORDS if RAG_STOPWORDS else None, stem)
+    return _pipelines[key]
+
+def _tokenizer_id() -> int:
+    """Stable integer id of the tokenizer pipeline, stored with term stats and the index"""
+    return zlib.crc32(_pipeline()[0].encode())
+
+def _terms(text: str) -> List[str]:
+    """Index/query terms: tokens after the optional stopword and stemming steps"""
+    _, stopwords, stem = _pipeline()
+    tokens = _tokenize(text)
+    if stopwords:
+        tokens = [t for t in tokens if t not in stopwords]
+    if stem:
+        tokens = [stem(t) for t in tokens]
+    return tokens
+
+def _term_counts(text: str) -> Dict[str, int]:
+    """{term: tf} for one document"""
+    return dict(Counter(_terms(text)))
+
+@lru_cache(maxsize=4096)
+def _cached_query_terms(query: str, tokenizer: str) -> Tuple[Tuple[str, int], ...]:
+    return tuple(Counter(_terms(query)).items())
+
+def _query_terms(query: str) -> Tuple[Tuple[str, int], ...]:
+    """(term, qtf) pairs for a query, memoized per tokenizer pipeline"""
+    return _cached_query_terms(query, _pipeline()[0])
+
+class _PackedPostings:
+    """Term -> postings view over a memory-mapped int32 file.
+
+    The mapped base is read-only; postings added after load are kept in a
+    small in-memory overlay until the next compaction rewrites the file.
+    """
+
+    def __init__(self, vocab: Dict[str, List[int]], data: memoryview):
+        self.vocab = vocab  # term -> [offset, count] in (doc_id, tf) pairs
+        self.data = data
+        self.extra: Dict[str, List[Tuple[int, int]]] = {}
+
+    def get(self, token: str,
+            default: Optional[List[Tuple[int, int]]] = None) -> Optional[List[Tuple[int, int]]]:
+        entry = self.vocab.get(token)
+        extra = self.extra.get(token)
+        if entry is None:
+            return extra if extra is not None else default
+        offset, count = entry
+        chunk = self.data[2 * offset:2 * (offset + count)]
+        postings = list(zip(chunk[0::2], chunk[1::2]))
+        if extra:
+            postings.extend(extra)
+        return postings
+
+    def add(self, token: str, doc_id: int, tf: int) -> None:
+        self.extra.setdefault(token, []).append((doc_id, tf))
+
+    def items(self) -> Iterator[Tuple[str, List[Tuple[int, int]]]]:
+        for token in self.vocab:
+            yield token, self.get(token) or []
+        for token in self.extra:
+            if token not in self.vocab:
+                yield token, self.extra[token]
+
+    def __contains__(self, token: str) -> bool:
+        return token in self.vocab or token in self.extra
+
+    def __len__(self) -> int:
+        return len(self.vocab) + sum(1 for token in self.extra if token not in self.vocab)
+
 class BM25Scorer:
-    """Simple BM25 scorer implementation"""
+    """BM25 scorer backed by an inverted index (term -> postings of doc_id/tf)"""
 
     def __init__(self, k1: float = 1.2, b: float = 0.75):
         self.k1 = k1
         self.b = b
-        self.doc_freqs = defaultdict(int)
-        self.idf = {}
-        self.doc_len = []
-        self.avgdl = 0
+        self.postings: Union[Dict[str, List[Tuple[int, int]]], _PackedPostings] = {}
+        self.doc_freqs: Dict[str, int] = defaultdict(int)
+        self.doc_len: Union[array, memoryview] = array("i")  # indexed by doc_id, -1 for unknown ids
+        self.total_len = 0
+        self.avgdl: float = 0
         self.N = 0
-        self.documents = []
 
-    def fit(self, documents: List[str]):
-        """Fit BM25 on corpus"""
-        self.documents = documents
-        self.N = len(documents)
-        self.doc_len = [len(self._tokenize(doc)) for doc in documents]
-        self.avgdl = sum(self.doc_len) / self.N if self.N > 0 else 0
+    def fit(self, documents: List[str], doc_ids: Optional[List[int]] = None) -> None:
+        """Fit BM25 on corpus, building postings and document lengths.
 
-        # Calculate document frequencies
-        for doc in documents:
-            tokens = set(self._tokenize(doc))
-            for token in tokens:
-                self.doc_freqs[token] += 1
+        doc_ids defaults to the position of each document in the list.
+        """
+        self.fit_counts([_term_counts(doc) for doc in documents], doc_ids)
 
-        # Calculate IDF
-        for token, freq in self.doc_freqs.items():
-            self.idf[token] = math.log(self.N - freq + 0.5) - math.log(freq + 0.5)
+    def fit_counts(self, term_counts: List[Dict[str, int]], doc_ids: Optional[List[int]] = None) -> None:
+        """Fit BM25 from pre-tokenized {term: tf} documents (see term_freqs)"""
+        if doc_ids is None:
+            doc_ids = list(range(len(term_counts)))
 
-    def _tokenize(self, text: str) -> List[str]:
-        """Simple tokenization"""
-        # Convert to lowercase and extract alphanumeric tokens
-        tokens = re.findall(r'\b\w+\b', text.lower())
-        return [t for t in tokens if len(t) > 2]  # Filter very short tokens
-
-    def score(self, query: str, doc_idx: int) -> float:
-        """Calculate BM25 score for query-document pair"""
-        if doc_idx >= len(self.documents):
-            return 0.0
+        inverted: Dict[str, List[Tuple[int, int]]] = {}
+        self.postings = inverted
+        self.doc_freqs = defaultdict(int)
+        self.doc_len = array("i", [-1]) * (max(doc_ids, default=-1) + 1)
+        self.N = len(term_counts)
 
-        doc = self.documents[doc_idx]
-        doc_tokens = self._tokenize(doc)
-        query_tokens = self._tokenize(query)
+        total_len = 0
+        for doc_id, counts in zip(doc_ids, term_counts):
+            length = sum(counts.values())
+            self.doc_len[doc_id] = length
+            total_len += length
+            for token, tf in counts.items():
+                inverted.setdefault(token, []).append((doc_id, tf))
 
-        doc_len = len(doc_tokens)
-        if doc_len == 0:
-            return 0.0
+        self.total_len = total_len
+        self.avgdl = total_len / self.N if self.N > 0 else 0
 
-        # Count query tokens in document
-        token_counts = Counter(doc_tokens)
+        # Calculate document frequencies
+        for token, postings in self.postings.items():
+            self.doc_freqs[token] = len(postings)
+
+    def add_document(self, doc_id: int, text: str) -> None:
+        """Index one new document, updating postings, df and avgdl in place"""
+        self.add_counts(doc_id, _term_counts(text))
+
+    def add_counts(self, doc_id: int, counts: Dict[str, int]) -> None:
+        """Index one pre-tokenized {term: tf} document in place"""
+        length = sum(counts.values())
+
+        if not isinstance(self.doc_len, array):
+            self.doc_len = array("i", self.doc_len)  # copy the mapped lengths once
+        if doc_id >= len(self.doc_len):
+            self.doc_len.extend([-1] * (doc_id + 1 - len(self.doc_len)))
+        self.doc_len[doc_id] = length
+
+        for token, tf in counts.items():
+            if isinstance(self.postings, dict):
+                self.postings.setdefault(token, []).append((doc_id, tf))
+            else:
+                self.postings.add(token, doc_id, tf)
+            self.doc_freqs[token] += 1
+
+        self.N += 1
+        self.total_len += length
+        self.avgdl = self.total_len / self.N
+
+    def with_stats(self, N: int, total_len: int, doc_freqs: Dict[str, int]) -> "BM25Scorer":
+        """View of this index that scores with outside corpus statistics.
+
+        Postings and document lengths are shared; N, avgdl and the document
+        frequencies (only the query terms are needed) are replaced, e.g. by
+        totals summed over every shard so shard scores are comparable.
+        """
+        view = copy.copy(self)
+        view.N = N
+        view.total_len = total_len
+        view.avgdl = total_len / N if N > 0 else 0
+        view.doc_freqs = doc_freqs
+        return view
+
+    def _idf(self, token: str) -> float:
+        """IDF from the current document frequency (kept lazy so adds stay O(doc))"""
+        freq = self.doc_freqs.get(token, 0)
+        return math.log(self.N - freq + 0.5) - math.log(freq + 0.5)
 
-        score = 0.0
-        for token in query_tokens:
-            if token in token_counts:
-                tf = token_counts[token]
-                idf = self.idf.get(token, 0)
+    def _tokenize(self, text: str) -> List[str]:
+        return _terms(text)
+
+    def _accumulate(self, query: str) -> Dict[int, float]:
+        """Score every document that contains at least one query term"""
+        scores: Dict[int, float] = defaultdict(float)
+        for token, qtf in _query_terms(query):
+            postings = self.postings.get(token)
+            if not postings:
+                continue
+            idf = self._idf(token)
+            for doc_id, tf in postings:
+                doc_len = self.doc_len[doc_id]
                 numerator = tf * (self.k1 + 1)
                 denominator = tf + self.k1 * (1 - self.b + self.b * (doc_len / self.avgdl))
-                score += idf * (numerator / denominator)
+                scores[doc_id] += qtf * idf * (numerator / denominator)
+        return scores
 
+    def score_counts(self, query: str, doc_id: int, counts: Dict[str, int]) -> float:
+        """BM25 of one document from its stored {term: tf}, without scanning postings"""
+        if doc_id >= len(self.doc_len) or self.doc_len[doc_id] < 0:
+            return 0.0
+        doc_len = self.doc_len[doc_id]
+        score = 0.0
+        for token, qtf in _query_terms(query):
+            tf = counts.get(token)
+            if not tf:
+                continue
+            numerator = tf * (self.k1 + 1)
+            denominator = tf + self.k1 * (1 - self.b + self.b * (doc_len / self.avgdl))
+            score += qtf * self._idf(token) * (numerator / denominator)
         return score
 
+    def score(self, query: str, doc_id: int) -> float:
+        """Calculate BM25 score for a single query-document pair"""
+        if doc_id >= len(self.doc_len) or self.doc_len[doc_id] < 0:
+            return 0.0
+        return self._accumulate(query).get(doc_id, 0.0)
+
+    def search(self, query: str, top_k: int, scores: Optional[Dict[int, float]] = None) -> List[Tuple[int, float]]:
+        """Return the top_k (doc_id, score) pairs with a positive score.
+
+        Documents tied with the k-th score are kept as well so callers can
+        break the tie (e.g. with vector similarity) before truncating, up to
+        top_k * BM25_TIE_FACTOR hits in all (a query term found in thousands
+        of equal-length documents would otherwise return all of them).
+        Pass precomputed _accumulate() scores to avoid scoring twice.
+        """
+        if scores is None:
+            scores = self._accumulate(query)
+        positive = [(doc_id, s) for doc_id, s in scores.items() if s > 0]
+        if top_k <= 0 or not positive:
+            return []
+
+        top = heapq.nlargest(top_k, positive, key=lambda item: item[1])
+        if len(top) == top_k:
+            cutoff = top[-1][1]
+            chosen = {doc_id for doc_id, _ in top}
+            ties = ((doc_id, s) for doc_id, s in positive if s == cutoff and doc_id not in chosen)
+            top.extend(itertools.islice(ties, top_k * max(1, BM25_TIE_FACTOR) - top_k))
+        return top
+
+    def save(self, directory: Path, tag: str) -> Dict[str, Any]:
+        """Write postings and document lengths as packed int32 files.
+
+        Returns the manifest entry needed by load().
+        """
+        vocab = {}
+        packed = array("i")
+        for token, postings in sorted(self.postings.items()):
+            vocab[token] = [len(packed) // 2, len(postings)]
+            for doc_id, tf in postings:
+                packed.append(doc_id)
+                packed.append(tf)
+
+        postings_file = f"postings-{tag}.bin"
+        doc_len_file = f"doclens-{tag}.bin"
+        doc_len = array("i", self.doc_len)  # copied before any file is replaced
+        _write_new_file(directory / postings_file, packed.tofile)
+        _write_new_file(directory / doc_len_file, doc_len.tofile)
+
+        return {
+            "k1": self.k1,
+            "b": self.b,
+            "N": self.N,
+            "total_len": self.total_len,
+            "avgdl": self.avgdl,
+            "postings": postings_file,
+            "doc_len": doc_len_file,
+            "vocab": vocab,
+        }
+
+    @classmethod
+    def load(cls, directory: Path, entry: Dict[str, Any]) -> "BM25Scorer":
+        """Load a scorer saved by save(), memory-mapping the packed files"""
+        scorer = cls(k1=entry["k1"], b=entry["b"])
+        scorer.N = entry["N"]
+        scorer.total_len = entry["total_len"]
+        scorer.avgdl = entry["avgdl"]
+        scorer.postings = _PackedPostings(entry["vocab"], _map_int32(directory / entry["postings"]))
+        scorer.doc_len = _map_int32(directory / entry["doc_len"])
+        for token, (_, freq) in entry["vocab"].items():
+            scorer.doc_freqs[token] = freq
+        return scorer
+
+_encode_slots = threading.BoundedSemaphore(max(1, RAG_MAX_CONCURRENT_ENCODES))
+
+# Process-wide model registry: every caller shares one instance per model name
+_model_registry: Dict[Tuple[str, Any], Any] = {}
+_model_registry_lock = threading.Lock()
+
+def get_model(name: Optional[str] = None) -> Any:
+    """Shared sentence transformer for name (default VECTOR_MODEL); None if unavailable.
+
+    Loaded once per process under a lock, so concurrent first queries wait
+    for one load instead of each reading the weights. A failed load is
+    remembered until reset_models().
+    """
+    if not VECTOR_AVAILABLE:
+        return None
+    key = (name or VECTOR_MODEL, SentenceTransformer)
+    with _model_registry_lock:
+        if key not in _model_registry:
+            try:
+                _model_registry[key] = SentenceTransformer(key[0])
+            except Exception as e:
+                print(f"[RAG] Warning: Could not load vector model: {e}")
+                _model_registry[key] = None
+        return _model_registry[key]
+
+def loaded_models() -> List[str]:
+    """Names of the models currently held by the registry"""
+    with _model_registry_lock:
+        return sorted(name for (name, _), model in _model_registry.items() if model is not None)
+
+def warm_up(load_index: bool = True) -> Dict[str, Any]:
+    """Load the embedding model (and the index) now rather than on the first query.
+
+    When sharded, the index is loaded inside every shard worker instead.
+    """
+    started = time.perf_counter()
+    model = get_model()
+    if model is not None:
+        try:
+            _encode(model, ["warm up"])  # first call initializes lazy kernels and tokenizer caches
+        except Exception as e:
+            print(f"[RAG] Warning: Model warm-up encode failed: {e}")
+    if RAG_SHARDS > 1:
+        index_loaded = bool(load_index and available() and _shards().warm_up())
+    else:
+        index_loaded = bool(load_index and available() and _ensure_models()[0])
+    return {
+        "model": VECTOR_MODEL,
+        "model_loaded": model is not None,
+        "index_loaded": index_loaded,
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+def preload_for_fork() -> Dict[str, Any]:
+    """Warm up in a parent process that is about to fork its workers.
+
+    Forked children then share the model weights and the mapped index
+    copy-on-write. gc.freeze() moves everything loaded so far out of the
+    collector's reach, so collections in the children don't write to (and
+    un-share) those pages. Threads and connections don't survive a fork, so
+    a pending rebuild is finished and this process's connections are closed.
+    """
+    status = warm_up(load_index=True)
+    wait_for_rebuild()
+    close_connections()
+    gc.collect()
+    gc.freeze()
+    status["frozen_objects"] = gc.get_freeze_count()
+    return status
+
+def _encode(model: Any, texts: List[str]) -> Any:
+    """model.encode() capped at RAG_MAX_CONCURRENT_ENCODES concurrent calls"""
+    with _encode_slots:
+        return model.encode(texts, show_progress_bar=False)
+
+def _pool_enabled(count: int) -> bool:
+    return VECTOR_AVAILABLE and RAG_EMBED_WORKERS > 1 and count >= RAG_EMBED_POOL_MIN
+
+def _bulk_encode(texts: List[str], model: Any = None) -> Any:
+    """Encode many texts, on the embedding worker pool when it is worth it.
+
+    Falls back to the in-process model (given, or the storage model) for
+    small batches, with RAG_EMBED_WORKERS <= 1, or if the pool fails.
+    """
+    if _pool_enabled(len(texts)):
+        try:
+            from utils.embedding_pool import get_pool
+            pool = get_pool(VECTOR_MODEL, RAG_EMBED_WORKERS, RAG_EMBED_BATCH, SentenceTransformer)
+            return pool.encode(texts)
+        except Exception as e:
+            print(f"[RAG] Warning: Embedding pool failed, encoding in-process: {e}")
+    model = model or _storage_model()
+    if model is None:
+        raise RuntimeError("vector model not available")
+    return _encode(model, texts)
+
+def _normalize_rows(matrix: Any) -> Any:
+    """Return a float32 copy of matrix with every row scaled to unit length"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _storage_dtype() -> str:
+    """Configured embedding storage dtype (unknown values mean float32)"""
+    return RAG_VECTOR_DTYPE if RAG_VECTOR_DTYPE in STORAGE_DTYPES else "float32"
+
+def _empty_rows(n: int, dim: int) -> Any:
+    """Uninitialized embedding matrix in the configured storage dtype"""
+    dtype = _storage_dtype()
+    if dtype == "float32":
+        return np.empty((n, dim), dtype=np.float32)
+    return QuantizedMatrix.empty(n, dim, dtype)
+
+def _pack_rows(matrix: Any) -> Any:
+    """Normalize float rows and store them in the configured dtype"""
+    matrix = _normalize_rows(matrix)
+    dtype = _storage_dtype()
+    return matrix if dtype == "float32" else QuantizedMatrix.from_float(matrix, dtype)
+
+def _encode_blob(vector: Any) -> bytes:
+    """Serialize one embedding for the vector_embedding column.
+
+    float32 and float16 BLOBs are the raw values; int8 BLOBs are a float32
+    scale followed by the int8 codes.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    dtype = _storage_dtype()
+    if dtype == "float32":
+        return vector.tobytes()
+    quantized = QuantizedMatrix.from_float(vector.reshape(1, -1), dtype)
+    if quantized.scales is None:
+        return quantized.codes.tobytes()
+    return quantized.scales.tobytes() + quantized.codes.tobytes()
+
+def _decode_blob(blob: bytes, dim: int) -> Any:
+    """Decode a vector_embedding BLOB of any storage dtype to float32.
+
+    The dtype is told apart by length (4*dim, 2*dim or dim+4 bytes), trying
+    the configured one first; returns None for BLOBs of another dimension.
+    """
+    sizes = {"float32": 4 * dim, "float16": 2 * dim, "int8": dim + 4}
+    configured = _storage_dtype()
+    for dtype in sorted(STORAGE_DTYPES, key=lambda d: d != configured):
+        if len(blob) != sizes[dtype]:
+            continue
+        if dtype == "float32":
+            return np.frombuffer(blob, dtype=np.float32)
+        if dtype == "float16":
+            return np.frombuffer(blob, dtype=np.float16).astype(np.float32)
+        scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+        return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+    return None
+
 class VectorTieBreak:
-    """Vector similarity for tie-breaking BM25 scores"""
+    """Vector similarity for tie-breaking BM25 scores
 
-    def __init__(self):
-        self.model = None
-        self.embeddings = None
-        self._load_model()
+    Document embeddings are kept L2-normalized, so cosine similarity against
+    an encoded (and normalized) query is a single matrix-vector product.
+    With RAG_VECTOR_DTYPE=float16/int8 the matrix is a QuantizedMatrix and
+    that product runs on the compact codes.
+    """
 
-    def _load_model(self):
-        """Load sentence transformer model"""
-        if not VECTOR_AVAILABLE:
+    def __init__(self, model: Any = None) -> None:
+        self.model = model
+        self.embeddings: Any = None  # float32 ndarray or QuantizedMatrix
+        self.row_of: Dict[int, int] = {}
+        self.row_ids: Union[List[int], memoryview] = []  # row -> doc_id
+        self.ann: Optional[IVFIndex] = None  # IVFIndex over embeddings, built for large corpora
+        self._buffer: Any = None  # over-allocated backing store for add()
+        if model is None:
+            self._load_model()
+
+    def _load_model(self) -> None:
+        """Use the shared sentence transformer from the model registry"""
+        self.model = get_model()
+
+    def _set_rows(self, doc_ids: Union[List[int], memoryview]) -> None:
+        """Reset row bookkeeping after the embedding matrix was replaced"""
+        self.row_ids = doc_ids
+        self.row_of = {doc_id: row for row, doc_id in enumerate(doc_ids)}
+        self.ann = None
+        self._buffer = None
+
+    def fit(self, documents: List[str], doc_ids: Optional[List[int]] = None) -> None:
+        """Fit vector model on corpus
+
+        doc_ids defaults to the position of each document in the list.
+        """
+        if not self.model:
             return
+        if doc_ids is None:
+            doc_ids = list(range(len(documents)))
         try:
-            self.model = SentenceTransformer(VECTOR_MODEL)
+            self.embeddings = _pack_rows(_bulk_encode(documents, self.model))
+            self._set_rows(doc_ids)
         except Exception as e:
-            print(f"[RAG] Warning: Could not load vector model: {e}")
-            self.model = None
+            print(f"[RAG] Warning: Could not encode documents: {e}")
+            self.embeddings = None
 
-    def fit(self, documents: List[str]):
-        """Fit vector model on corpus"""
+    def fit_from_db(self, conn: sqlite3.Connection, batch_size: int = VECTOR_BACKFILL_BATCH,
+                    max_id: Optional[int] = None) -> None:
+        """Load stored vector_embedding BLOBs into one contiguous matrix.
+
+        Only rows with a NULL (or wrong-sized) embedding are encoded, in
+        batches, and written back so the next cold start skips them too.
+        Rows are decoded and packed into the storage dtype a chunk at a time.
+        max_id bounds the snapshot to rows that existed when a build started.
+        """
         if not self.model:
             return
         try:
-            self.embeddings = self.model.encode(documents, show_progress_bar=False)
+            dim = self.model.get_sentence_embedding_dimension()
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, vector_embedding FROM embeddings WHERE id <= ? ORDER BY id",
+                           (max_id if max_id is not None else sys.maxsize,))
+            rows = cursor.fetchall()
+
+            sizes = {4 * dim, 2 * dim, dim + 4}
+            blobs = {doc_id: blob for doc_id, blob in rows if blob is not None and len(blob) in sizes}
+            missing = [doc_id for doc_id, _ in rows if doc_id not in blobs]
+            if _pool_enabled(len(missing)):
+                batch_size = max(batch_size, RAG_EMBED_BATCH * RAG_EMBED_WORKERS)  # one task per worker
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                placeholders = ",".join("?" for _ in batch)
+                cursor.execute(f"SELECT id, content FROM embeddings WHERE id IN ({placeholders})", batch)
+                fetched = cursor.fetchall()
+                encoded = _bulk_encode([content for _, content in fetched], self.model)
+                updates = []
+                for (doc_id, _), vec in zip(fetched, encoded):
+                    blob = _encode_blob(vec)
+                    blobs[doc_id] = blob
+                    updates.append((blob, doc_id))
+                cursor.executemany("UPDATE embeddings SET vector_embedding = ? WHERE id = ?", updates)
+                conn.commit()
+            if missing:
+                print(f"[RAG] Backfilled {len(missing)} missing embeddings")
+
+            doc_ids = [doc_id for doc_id, _ in rows]
+            embeddings = _empty_rows(len(doc_ids), dim)
+            for start in range(0, len(doc_ids), 4096):
+                chunk = [_decode_blob(blobs[doc_id], dim) for doc_id in doc_ids[start:start + 4096]]
+                embeddings[start:start + len(chunk)] = _normalize_rows(np.stack(chunk))
+            self.embeddings = embeddings
+            self._set_rows(doc_ids)
         except Exception as e:
-            print(f"[RAG] Warning: Could not encode documents: {e}")
+            print(f"[RAG] Warning: Could not load stored embeddings: {e}")
             self.embeddings = None
 
-    def cosine_similarity(self, query: str, doc_idx: int) -> float:
-        """Calculate cosine similarity for tie-breaking"""
+    def add(self, doc_id: int, vector: Any) -> None:
+        """Append one document embedding without re-encoding the corpus.
+
+        Rows go into an over-allocated buffer so repeated adds stay amortized
+        O(dim); the first add after a load copies the mapped matrix once.
+        """
+        if self.embeddings is None:
+            return
+        n, dim = self.embeddings.shape
+        quantized = isinstance(self.embeddings, QuantizedMatrix)
+        if self._buffer is None or n >= len(self._buffer):
+            capacity = max(16, n + n // 2 + 1)
+            if quantized:
+                buffer = self.embeddings.resized(capacity)
+            else:
+                buffer = np.empty((capacity, dim), dtype=np.float32)
+                buffer[:n] = self.embeddings
+            self._buffer = buffer
+        self._buffer[n] = _normalize_rows(np.asarray(vector, dtype=np.float32).reshape(1, dim))[0]
+        self.embeddings = self._buffer.head(n + 1) if quantized else self._buffer[:n + 1]
+        if not isinstance(self.row_ids, list):
+            self.row_ids = list(self.row_ids)  # copy the mapped ids once
+        self.row_ids.append(doc_id)
+        self.row_of[doc_id] = n
+        if self.ann is not None:
+            self.ann.add(n, self._buffer[n])
+
+    def ensure_ann(self) -> None:
+        """Build the IVF index once the corpus is large enough to need it"""
+        if self.ann is None and self.embeddings is not None and len(self.embeddings) >= RAG_ANN_MIN_ROWS:
+            self.ann = IVFIndex.build(self.embeddings, nlist=RAG_ANN_NLIST or None)
+
+    def search(self, query_vec: Any, k: int, exact: bool = False) -> List[Tuple[int, float]]:
+        """Top-k (doc_id, cosine) by vector similarity alone.
+
+        Uses the IVF index when one is built (sublinear in corpus size),
+        otherwise, or with exact=True, a brute-force scan of the matrix.
+        """
+        if query_vec is None or self.embeddings is None or k <= 0:
+            return []
+        if self.ann is not None and not exact:
+            rows, scores = self.ann.search(self.embeddings, query_vec, k, RAG_ANN_NPROBE)
+        else:
+            scores = inner_products(self.embeddings, query_vec)
+            rows = np.arange(len(scores))
+            if k < len(scores):
+                rows = np.argpartition(-scores, k - 1)[:k]
+                scores = scores[rows]
+            ranked = np.argsort(-scores, kind="stable")
+            rows, scores = rows[ranked], scores[ranked]
+        return [(self.row_ids[row], float(score)) for row, score in zip(rows, scores)]
+
+    def encode_query(self, query: str) -> Any:
+        """Encode a query once into a unit-length float32 vector (None on failure)"""
+        return self.encode_queries([query])[0]
+
+    def encode_queries(self, queries: List[str]) -> List[Any]:
+        """Encode queries in one transformer batch into unit-length float32 vectors.
+
+        Entries are None for queries that could not be encoded.
+        """
+        if not self.model or self.embeddings is None or not queries:
+            return [None] * len(queries)
+        try:
+            matrix = np.asarray(_encode(self.model, list(queries)), dtype=np.float32)
+        except Exception as e:
+            print(f"[RAG] Warning: Could not encode query: {e}")
+            return [None] * len(queries)
+        norms = np.linalg.norm(matrix, axis=1)
+        return [row / norm if norm > 0 else None for row, norm in zip(matrix, norms)]
+
+    def similarities(self, query_vec: Any, doc_ids: List[int]) -> Dict[int, float]:
+        """Cosine similarity of an encoded query against the given documents"""
+        if query_vec is None or self.embeddings is None:
+            return {}
+        known = [doc_id for doc_id in doc_ids if doc_id in self.row_of]
+        if not known:
+            return {}
+        rows = [self.row_of[doc_id] for doc_id in known]
+        scores = inner_products(self.embeddings, query_vec, rows)
+        return {doc_id: float(score) for doc_id, score in zip(known, scores)}
+
+    def cosine_similarity(self, query: str, doc_id: int) -> float:
+        """Calculate cosine similarity for one document (per-document fallback)"""
         if not self.model or self.embeddings is None:
             return 0.0
-        if doc_idx >= len(self.embeddings):
+        row = self.row_of.get(doc_id)
+        if row is None:
             return 0.0
 
         try:
-            query_vec = self.model.encode([query], show_progress_bar=False)
-            doc_vec = self.embeddings[doc_idx:doc_idx+1]
+            query_vec = _encode(self.model, [query])
+            doc_vec = self.embeddings[row:row+1]
 
             # Cosine similarity
             dot_product = np.dot(query_vec, doc_vec.T)[0][0]
@@ -139,123 +882,1122 @@ class VectorTieBreak:
             print(f"[RAG] Warning: Vector similarity failed: {e}")
             return 0.0
 
+    def save(self, directory: Path, tag: str) -> Optional[Dict[str, Any]]:
+        """Write embeddings as .npy plus a packed int32 row -> doc_id file
+
+        Quantized matrices keep their codes (and int8 scales) as written.
+        """
+        if self.embeddings is None:
+            return None
+        vectors_file = f"vectors-{tag}.npy"
+        ids_file = f"vector_ids-{tag}.bin"
+        scales_file = None
+        if isinstance(self.embeddings, QuantizedMatrix):
+            codes = np.asarray(self.embeddings.codes)
+            _write_new_file(directory / vectors_file, lambda f: np.save(f, codes))
+            if self.embeddings.scales is not None:
+                scales_file = f"vector_scales-{tag}.npy"
+                scales = np.asarray(self.embeddings.scales)
+                _write_new_file(directory / scales_file, lambda f: np.save(f, scales))
+            dtype = self.embeddings.dtype
+        else:
+            vectors = np.asarray(self.embeddings, dtype=np.float32)
+            _write_new_file(directory / vectors_file, lambda f: np.save(f, vectors))
+            dtype = "float32"
+        row_ids = array("i", self.row_ids)
+        _write_new_file(directory / ids_file, row_ids.tofile)
+        return {
+            "model": VECTOR_MODEL,
+            "dtype": dtype,
+            "vectors": vectors_file,
+            "scales": scales_file,
+            "ids": ids_file,
+            "ann": self.ann.save(directory, tag) if self.ann is not None else None,
+        }
+
+    def load(self, directory: Path, entry: Optional[Dict[str, Any]]) -> bool:
+        """Memory-map embeddings saved by save(); False if unusable"""
+        if not self.model or not entry or entry.get("model") != VECTOR_MODEL:
+            return False
+        if entry.get("dtype", "float32") != _storage_dtype():
+            return False  # storage dtype changed: repack from the DB
+        try:
+            vectors = np.load(directory / entry["vectors"], mmap_mode="r")
+            if entry.get("dtype") == "int8":
+                vectors = QuantizedMatrix(vectors, np.load(directory / entry["scales"], mmap_mode="r"))
+            elif entry.get("dtype") == "float16":
+                vectors = QuantizedMatrix(vectors)
+            self.embeddings = vectors
+            self._set_rows(_map_int32(directory / entry["ids"]))
+            if entry.get("ann"):
+                self.ann = IVFIndex.load(directory, entry["ann"])
+            return True
+        except Exception as e:
+            print(f"[RAG] Warning: Could not load stored embeddings: {e}")
+            self.embeddings = None
+            return False
+
 # Global models (cached)
-_bm25_model = None
-_vector_model = None
+_bm25_model: Optional[BM25Scorer] = None
+_vector_model: Optional[VectorTieBreak] = None
+_index_generation: Optional[int] = None
+_index_max_id = 0
+_adds_since_compaction = 0
+_persisted_state: Optional[Tuple[str, int, int]] = None  # (index dir, generation, max_id) of the artifact last saved or loaded
+_index_lock = threading.RLock()
+
+# Background rebuild bookkeeping (see index_status())
+_index_epoch = 0  # bumped by reset_models(); a build from an older epoch is discarded
+_build_thread: Optional[threading.Thread] = None
+_build_status: Dict[str, Any] = {
+    "state": "idle",  # idle | building | failed
+    "generation": None,  # corpus generation being (or last) built
+    "started_at": None,
+    "last_duration_seconds": None,
+    "last_finished_at": None,
+    "builds": 0,
+    "error": None,
+}
+
+class _ResultCache:
+    """LRU + TTL cache of retrieve() results.
+
+    Keys include the corpus generation, so any write to the snippet table
+    makes older entries unreachable; they are dropped as soon as a newer
+    generation is seen.
+    """
 
-def _ensure_models():
-    """Ensure BM25 and vector models are loaded"""
-    global _bm25_model, _vector_model
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._generation: Optional[Hashable] = None  # int, or a tuple of shard generations
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, key: tuple, generation: Hashable, results: List[Dict[str, Any]]) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()  # corpus changed: everything cached is stale
+                self._generation = generation
+            self._entries[key] = (time.monotonic(), copy.deepcopy(results))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._generation = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
 
-    if not available():
-        return False, False
+_result_cache = _ResultCache(RAG_CACHE_SIZE, RAG_CACHE_TTL)
+
+def cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and size of the retrieval result cache"""
+    return _result_cache.stats()
+
+def clear_cache() -> None:
+    """Drop all cached retrieval results"""
+    _result_cache.clear()
+
+def _corpus_generation() -> int:
+    """Current corpus generation"""
+    rows = _connect().execute("SELECT value FROM rag_meta WHERE key = 'generation'").fetchall()
+    return int(rows[0][0]) if rows else 0
+
+def _corpus_state() -> Tuple[int, int]:
+    """Return (generation, max snippet id) for the embeddings DB"""
+    max_id = _connect().execute("SELECT MAX(id) FROM embeddings").fetchall()[0][0] or 0
+    return _corpus_generation(), max_id
+
+def _check_tokenizer(conn: sqlite3.Connection) -> None:
+    """Drop stored term stats written by a different tokenizer pipeline"""
+    tokenizer = _tokenizer_id()
+    rows = conn.execute("SELECT value FROM rag_meta WHERE key = 'tokenizer'").fetchall()
+    if rows and rows[0][0] == tokenizer:
+        return
+    with conn:
+        if rows:
+            print("[RAG] Tokenizer pipeline changed, re-tokenizing stored snippets")
+            conn.execute("DELETE FROM term_freqs")
+        conn.execute("INSERT OR REPLACE INTO rag_meta (key, value) VALUES ('tokenizer', ?)", (tokenizer,))
+
+def _load_term_counts(conn: sqlite3.Connection, after_id: int = 0, upto_id: Optional[int] = None,
+                      batch_size: int = 512) -> List[Tuple[int, Dict[str, int], Optional[bytes]]]:
+    """(id, {term: tf}, vector_embedding) for snippets with after_id < id <= upto_id.
+
+    Term stats come from term_freqs; content is read (and tokenized, and the
+    stats written back) only for rows inserted without them, e.g. by other
+    tools writing to the DB directly.
+    """
+    _check_tokenizer(conn)
+    rows = conn.execute("""
+        SELECT e.id, t.terms, e.vector_embedding FROM embeddings e
+        LEFT JOIN term_freqs t ON t.id = e.id
+        WHERE e.id > ? AND e.id <= ? ORDER BY e.id
+    """, (after_id, upto_id if upto_id is not None else sys.maxsize)).fetchall()
+
+    missing = [doc_id for doc_id, terms, _ in rows if terms is None]
+    backfilled: Dict[int, Dict[str, int]] = {}
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        placeholders = ",".join("?" for _ in batch)
+        fetched = conn.execute(f"SELECT id, content FROM embeddings WHERE id IN ({placeholders})", batch).fetchall()
+        with conn:
+            for doc_id, content in fetched:
+                backfilled[doc_id] = _term_counts(content or "")
+                conn.execute("INSERT OR REPLACE INTO term_freqs (id, terms) VALUES (?, ?)",
+                             (doc_id, json.dumps(backfilled[doc_id])))
+    if missing:
+        print(f"[RAG] Backfilled term stats for {len(missing)} snippets")
+
+    return [
+        (doc_id, backfilled.get(doc_id, {}) if terms is None else json.loads(terms), blob)
+        for doc_id, terms, blob in rows
+    ]
 
+def _read_manifest() -> Optional[Dict[str, Any]]:
+    """Read the persisted index manifest, if any"""
+    path = _index_dir() / "manifest.json"
+    if not path.exists():
+        return None
     try:
-        conn = sqlite3.connect(str(EMBEDDINGS_DB))
-        cursor = conn.cursor()
-        cursor.execute("SELECT content FROM embeddings ORDER BY id")
-        documents = [row[0] for row in cursor.fetchall()]
-        conn.close()
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[RAG] Warning: Ignoring unreadable index manifest: {e}")
+        return None
+
+def _save_index(generation: int, max_id: int, bm25: BM25Scorer,
+                vector: Optional[VectorTieBreak]) -> Dict[str, Any]:
+    """Persist the index artifact for a corpus generation; returns its manifest.
+
+    Data files carry the generation, pid and a per-save nonce in their
+    names, so a save never overwrites files an index has mapped, and the
+    manifest is swapped in last, so readers never see a half-written artifact.
+    """
+    directory = _index_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    tag = f"{generation}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+    manifest = {
+        "version": INDEX_FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "generation": generation,
+        "max_id": max_id,
+        "tokenizer": _tokenizer_id(),
+        "bm25": bm25.save(directory, tag),
+        "vector": vector.save(directory, tag) if vector else None,
+    }
+    tmp_path = directory / f"manifest.json.{tag}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, directory / "manifest.json")
+    _mark_persisted(generation, max_id)
+
+    # Drop data files from older generations and this process's earlier saves
+    # of this one (unlinking keeps mapped files readable)
+    for path in directory.iterdir():
+        parts = path.stem.split("-")  # kind, generation, pid, nonce
+        if len(parts) >= 3 and path.suffix in (".bin", ".npy"):
+            try:
+                file_generation, file_pid = int(parts[1]), int(parts[2])
+                if file_generation < generation or (
+                        file_generation == generation and file_pid == os.getpid() and tag not in path.name):
+                    path.unlink()
+            except (ValueError, OSError):
+                continue
+    return manifest
+
+def _mark_persisted(generation: int, max_id: int) -> None:
+    """Record that the artifact on disk holds exactly this generation"""
+    global _persisted_state
+    _persisted_state = (str(_index_dir()), generation, max_id)
+
+def _load_index() -> Tuple[Optional[BM25Scorer], Optional[Dict[str, Any]], int, int]:
+    """Load the persisted BM25 index, whatever generation it was saved at.
+
+    Returns (scorer, vector manifest entry, generation, max_id); scorer is
+    None when there is no usable artifact.
+    """
+    manifest = _read_manifest()
+    if not manifest:
+        return None, None, -1, 0
+    if (manifest.get("version") != INDEX_FORMAT_VERSION
+            or manifest.get("byteorder") != sys.byteorder
+            or manifest.get("tokenizer") != _tokenizer_id()):
+        return None, None, -1, 0
+    try:
+        scorer = BM25Scorer.load(_index_dir(), manifest["bm25"])
+        return scorer, manifest.get("vector"), manifest["generation"], manifest["max_id"]
+    except (OSError, KeyError, ValueError) as e:
+        print(f"[RAG] Warning: Could not load index artifact: {e}")
+        return None, None, -1, 0
+
+def _apply_rows(bm25: BM25Scorer, vector: Optional[VectorTieBreak],
+                rows: List[Tuple[int, Dict[str, int], Optional[bytes]]]) -> None:
+    """Add (id, {term: tf}, vector_embedding) rows to already-loaded models.
+
+    Rows stored without a usable embedding (NULL, e.g. written by a tool
+    without the model, or of another dimension) are encoded in one batch and
+    their BLOBs written back, as VectorTieBreak.fit_from_db() does on a full
+    build, so they don't drop out of vector ranking until the next refit.
+    """
+    global _index_max_id, _adds_since_compaction
+    if vector is not None and vector.embeddings is not None and vector.model:
+        rows = _backfill_blobs(rows, vector.model, vector.embeddings.shape[1])
+    for doc_id, counts, blob in rows:
+        bm25.add_counts(doc_id, counts)
+        if blob is not None and vector is not None and vector.embeddings is not None:
+            decoded = _decode_blob(blob, vector.embeddings.shape[1])
+            if decoded is not None:
+                vector.add(doc_id, decoded)
+        _index_max_id = max(_index_max_id, doc_id)
+    _adds_since_compaction += len(rows)
+
+def _backfill_blobs(rows: List[Tuple[int, Dict[str, int], Optional[bytes]]], model: Any,
+                    dim: int) -> List[Tuple[int, Dict[str, int], Optional[bytes]]]:
+    """Encode and store the embeddings missing from rows; rows come back with their new BLOBs.
+
+    Writing only vector_embedding does not bump the corpus generation.
+    """
+    missing = [doc_id for doc_id, _, blob in rows if blob is None or _decode_blob(blob, dim) is None]
+    if not missing:
+        return rows
+    blobs: Dict[int, bytes] = {}
+    try:
+        conn = _connect()
+        for start in range(0, len(missing), VECTOR_BACKFILL_BATCH):
+            batch = missing[start:start + VECTOR_BACKFILL_BATCH]
+            placeholders = ",".join("?" for _ in batch)
+            fetched = conn.execute(f"SELECT id, content FROM embeddings WHERE id IN ({placeholders})", batch).fetchall()
+            encoded = _bulk_encode([content or "" for _, content in fetched], model)
+            updates = [(_encode_blob(vec), doc_id) for (doc_id, _), vec in zip(fetched, encoded)]
+            with conn:
+                conn.executemany("UPDATE embeddings SET vector_embedding = ? WHERE id = ?", updates)
+            blobs.update((doc_id, blob) for blob, doc_id in updates)
+    except Exception as e:
+        print(f"[RAG] Warning: Could not backfill embeddings: {e}")
+    if blobs:
+        print(f"[RAG] Backfilled {len(blobs)} missing embeddings")
+    return [(doc_id, counts, blobs.get(doc_id, blob)) for doc_id, counts, blob in rows]
 
-        if not documents:
-            return False, False
+def _catch_up(bm25: BM25Scorer, vector: Optional[VectorTieBreak], from_generation: int, from_max_id: int, generation: int) -> bool:
+    """Apply snippets written since from_generation as incremental adds.
+
+    Only valid when every generation bump since then was an append, i.e.
+    the number of rows past from_max_id equals the generation delta.
+    """
+    pending = generation - from_generation
+    if pending <= 0:
+        return pending == 0
+    conn = _connect()
+    if conn.execute("SELECT COUNT(*) FROM embeddings WHERE id > ?", (from_max_id,)).fetchall()[0][0] != pending:
+        return False  # not a pure append; don't read the rows
+    rows = _load_term_counts(conn, after_id=from_max_id)
+    if len(rows) != pending:
+        return False
+    _apply_rows(bm25, vector, rows)
+    return True
+
+def compact_index() -> bool:
+    """Fold incremental updates into a fresh index artifact and remap it.
+
+    Runs automatically every RAG_COMPACT_EVERY incremental adds; returns
+    False when there is nothing loaded to compact, or when nothing was
+    applied since the artifact on disk was saved or loaded.
+    """
+    global _bm25_model, _vector_model, _adds_since_compaction
+    with _index_lock:
+        if _bm25_model is None or _index_generation is None:
+            return False
+        if _persisted_state == (str(_index_dir()), _index_generation, _index_max_id):
+            _adds_since_compaction = 0
+            return False
+        if _vector_model is not None and _vector_model.embeddings is not None:
+            _vector_model.ensure_ann()
+        manifest = _save_index(_index_generation, _index_max_id, _bm25_model, _vector_model)
+        # Map the files just written, not whatever manifest.json names now:
+        # another worker may already have swapped in a different generation
+        directory = _index_dir()
+        try:
+            _bm25_model = BM25Scorer.load(directory, manifest["bm25"])
+        except (OSError, KeyError, ValueError) as e:
+            print(f"[RAG] Warning: Keeping the in-memory index, compacted files are gone: {e}")
+        if _vector_model is not None and _vector_model.embeddings is not None:
+            vector = VectorTieBreak(_vector_model.model)
+            if vector.load(directory, manifest["vector"]):
+                _vector_model = vector
+        _adds_since_compaction = 0
+        return True
+
+def _maybe_compact() -> None:
+    """Compact once enough incremental adds have piled up (never raises)"""
+    if _adds_since_compaction < RAG_COMPACT_EVERY:
+        return
+    if _build_thread is not None and _build_thread.is_alive():
+        return  # the rebuild writes a fresh artifact anyway
+    try:
+        compact_index()
+    except Exception as e:
+        print(f"[RAG] Warning: Index compaction failed: {e}")
+
+def _build_index(generation: int, max_id: int, model: Any = None) -> Tuple[BM25Scorer, VectorTieBreak]:
+    """Fit BM25 and vector models on rows up to max_id and persist the artifact.
+
+    Touches no global state, so it can run while the old index keeps serving.
+    """
+    conn = _connect()
+    rows = _load_term_counts(conn, upto_id=max_id)
+    bm25 = BM25Scorer()
+    bm25.fit_counts([row[1] for row in rows], [row[0] for row in rows])
+    vector = VectorTieBreak(model)
+    if vector.model:
+        vector.fit_from_db(conn, max_id=max_id)
+    try:
+        if vector.embeddings is not None:
+            vector.ensure_ann()
+        _save_index(generation, max_id, bm25, vector)
+    except Exception as e:
+        print(f"[RAG] Warning: Could not persist index: {e}")
+    return bm25, vector
+
+def _install(bm25: BM25Scorer, vector: Optional[VectorTieBreak], generation: int, max_id: int) -> None:
+    """Swap in a new index (caller holds _index_lock)"""
+    global _bm25_model, _vector_model, _index_generation, _index_max_id, _adds_since_compaction
+    _bm25_model = bm25
+    _vector_model = vector
+    _index_generation = generation
+    _index_max_id = max_id
+    _adds_since_compaction = 0
+
+def _rebuild_in_background(epoch: int, model: Any) -> None:
+    """Builder thread body: build off-lock, then flip the model references"""
+    started = time.monotonic()
+    try:
+        generation, max_id = _corpus_state()
+        with _index_lock:
+            _build_status["generation"] = generation
+        bm25, vector = _build_index(generation, max_id, model)
+        with _index_lock:
+            if epoch == _index_epoch:
+                _install(bm25, vector, generation, max_id)
+            _build_status.update(state="idle", error=None)
+    except Exception as e:
+        print(f"[RAG] Warning: Background index rebuild failed: {e}")
+        with _index_lock:
+            _build_status.update(state="failed", error=str(e))
+    finally:
+        with _index_lock:
+            _build_status["last_duration_seconds"] = round(time.monotonic() - started, 3)
+            _build_status["last_finished_at"] = time.time()
+            _build_status["builds"] += 1
+        close_connections()  # the builder thread's pooled connection
+
+def _start_rebuild() -> None:
+    """Start the builder thread unless one is running or recently failed (caller holds _index_lock)"""
+    global _build_thread
+    if _build_thread is not None and _build_thread.is_alive():
+        return
+    if (_build_status["state"] == "failed"
+            and time.time() - (_build_status["last_finished_at"] or 0) < RAG_REBUILD_RETRY):
+        return
+    model = _vector_model.model if _vector_model is not None else None
+    _build_status.update(state="building", started_at=time.time(), error=None)
+    _build_thread = threading.Thread(
+        target=_rebuild_in_background, args=(_index_epoch, model), name="rag-index-build", daemon=True
+    )
+    _build_thread.start()
+
+def index_status() -> Dict[str, Any]:
+    """Serving index generation plus the state and timing of background rebuilds"""
+    with _index_lock:
+        status = dict(_build_status)
+        status["serving_generation"] = _index_generation
+        status["background_rebuild"] = RAG_BACKGROUND_REBUILD
+        return status
+
+def wait_for_rebuild(timeout: Optional[float] = None) -> bool:
+    """Block until a running background rebuild finishes; False on timeout"""
+    thread = _build_thread
+    if thread is not None:
+        thread.join(timeout)
+        return not thread.is_alive()
+    return True
+
+def _ensure_models() -> Tuple[bool, bool]:
+    """Ensure BM25 and vector models are loaded for the current corpus generation.
+
+    Snippets appended since the loaded (or persisted) index are applied
+    incrementally; the full refit only runs when there is no usable artifact
+    or the corpus changed in a way that is not a pure append. When an older
+    index can keep serving (the loaded one, or a stale artifact) the refit
+    runs on a background thread and is swapped in when it finishes, so
+    queries never wait on it.
+
+    With RAG_SHARDS > 1 each shard worker holds its own index and this
+    process none, so nothing is loaded (and no unsharded DB is created).
+    """
+    global _index_generation
 
-        # Initialize BM25
-        if _bm25_model is None:
-            _bm25_model = BM25Scorer()
-            _bm25_model.fit(documents)
+    if RAG_SHARDS > 1 or not available():
+        return False, False
 
-        # Initialize vector model
-        if _vector_model is None:
-            _vector_model = VectorTieBreak()
-            _vector_model.fit(documents)
+    try:
+        generation, max_id = _corpus_state()
+        if max_id == 0:
+            return False, False
 
-        return True, True
+        with _index_lock:
+            if _bm25_model is not None and _index_generation == generation:
+                return True, True
+            rebuilding = _build_thread is not None and _build_thread.is_alive()
+
+            # Another process appended snippets: apply them to what we have
+            if _bm25_model is not None and _index_generation is not None and not rebuilding and _catch_up(
+                    _bm25_model, _vector_model, _index_generation, _index_max_id, generation):
+                _index_generation = generation
+                _maybe_compact()
+                return True, True
+
+            if _bm25_model is None:
+                bm25, vector_entry, saved_generation, saved_max_id = _load_index()
+                vector = VectorTieBreak()
+                vector_loaded = vector.load(_index_dir(), vector_entry) if bm25 is not None else False
+                if bm25 is not None:
+                    # Serve the artifact as-is; catching up makes it current
+                    _install(bm25, vector, saved_generation, saved_max_id)
+                    _mark_persisted(saved_generation, saved_max_id)
+                    if (vector_loaded or not vector.model) and _catch_up(
+                            bm25, vector if vector_loaded else None, saved_generation, saved_max_id, generation):
+                        _index_generation = generation
+                        _maybe_compact()
+                        return True, True
+
+            if _bm25_model is not None and RAG_BACKGROUND_REBUILD:
+                _start_rebuild()
+                return True, True
+
+            # Nothing to serve meanwhile (or background rebuilds are off)
+            model = _vector_model.model if _vector_model is not None else None
+            bm25, vector = _build_index(generation, max_id, model)
+            _install(bm25, vector, generation, max_id)
+            return True, True
 
     except Exception as e:
         print(f"[RAG] Warning: Failed to load models: {e}")
         return False, False
 
 def available() -> bool:
-    """Check if RAG is available (embeddings DB exists)"""
+    """Check if RAG is available (embeddings DB, or any shard DB, exists)"""
+    if RAG_SHARDS > 1:
+        from utils.rag_shards import shard_paths
+        return any(path.exists() for path in shard_paths(EMBEDDINGS_DB, RAG_SHARDS))
     return EMBEDDINGS_DB.exists()
 
-def retrieve(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+_shard_store: Optional["ShardedStore"] = None
+
+def _shards() -> "ShardedStore":
+    """The ShardedStore for the current DB path and shard settings (started on first use)"""
+    global _shard_store
+    from utils.rag_shards import ShardedStore
+    with _index_lock:
+        store = _shard_store
+        if store is None or (store.base_path, store.num_shards, store.key) != (EMBEDDINGS_DB, RAG_SHARDS, RAG_SHARD_KEY):
+            if store is not None:
+                store.close()
+            # Workers re-import this module; hand them the settings in effect here
+            settings = {
+                name: value for name, value in globals().items()
+                if name.isupper() and isinstance(value, (bool, int, float, str))
+            }
+            _shard_store = store = ShardedStore(EMBEDDINGS_DB, RAG_SHARDS, RAG_SHARD_KEY, settings)
+        return store
+
+def shard_stats() -> List[Dict[str, Any]]:
+    """Per-shard generation and max id (empty when the store is not sharded)"""
+    return _shards().stats() if RAG_SHARDS > 1 else []
+
+RETRIEVAL_MODES = ("bm25", "vector", "hybrid")
+
+def retrieve(query: str, top_k: int = 3, mode: str = "bm25") -> List[Dict[str, Any]]:
     """
     Enhanced retrieval using BM25 + vector tie-break scoring.
     Returns list of {id, content, score, source, bm25_score, vector_score}
 
+    mode selects the ranking:
+      - "bm25":   keyword BM25, vector similarity only breaks ties (default)
+      - "vector": semantic-first nearest neighbours (IVF index on large corpora)
+      - "hybrid": reciprocal-rank fusion of the BM25 and vector top-N lists
+
+    Results are cached per (normalized query, top_k, mode, corpus generation),
+    see cache_stats().
+
     If embeddings DB doesn't exist, returns empty list (graceful degradation).
     """
-    if not available():
-        return []
+    return retrieve_many([query], top_k, mode)[0]
+
+def retrieve_many(queries: List[str], top_k: int = 3, mode: str = "bm25") -> List[List[Dict[str, Any]]]:
+    """Retrieve for several queries at once; returns one result list per query.
+
+    Cache misses share a single pass: one model check, one transformer batch
+    for all query embeddings and one row fetch for every winning snippet.
+    Repeated queries in the batch are ranked once.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+    if not queries or not available():
+        return [[] for _ in queries]
+    stats = None
+    generation: Optional[Hashable]
+    if RAG_SHARDS > 1:
+        # One round trip for corpus-wide BM25 statistics; the generation is every shard's
+        generation, stats = _shards().corpus_stats(queries)
+        if stats is None:
+            return [[] for _ in queries]
+    else:
+        generation = _corpus_generation()
+    results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+    pending: Dict[tuple, List[int]] = {}  # cache misses: key -> positions in queries
+    for i, query in enumerate(queries):
+        key = (" ".join(query.lower().split()), top_k, mode, RAG_BACKEND, generation)
+        cached = _result_cache.get(key) if key not in pending and generation is not None else None
+        if cached is None:
+            pending.setdefault(key, []).append(i)
+        else:
+            results[i] = cached
+
+    if pending:
+        first = [indices[0] for indices in pending.values()]
+        batch = [queries[i] for i in first]
+        computed: Optional[List[List[Dict[str, Any]]]]
+        if stats is not None:
+            computed = _shards().retrieve_many(batch, top_k, mode, stats)
+            stale = generation is None
+        else:
+            computed = _retrieve_uncached(batch, top_k, mode)
+            stale = _bm25_model is not None and _index_generation != generation
+        if computed is None:
+            return results  # degraded: misses stay empty and nothing is cached
+        # Answers from an older index while a rebuild runs are not cached
+        for (key, indices), ranked in zip(pending.items(), computed):
+            if not stale:
+                _result_cache.put(key, generation, ranked)
+            results[indices[0]] = ranked
+            for i in indices[1:]:
+                results[i] = copy.deepcopy(ranked)
+    return results
+
+def _retrieve_uncached(queries: List[str], top_k: int, mode: str) -> Optional[List[List[Dict[str, Any]]]]:
+    """Rank a batch of queries; None means retrieval degraded (models or DB unavailable)"""
+    if RAG_BACKEND == "fts5" and mode == "bm25":
+        try:
+            fts_results = [_retrieve_fts5(query, top_k) for query in queries]
+            results = [result for result in fts_results if result is not None]
+            if len(results) == len(fts_results):
+                return results
+        except Exception as e:
+            print(f"[RAG] Warning: FTS5 retrieve failed, using in-memory index: {e}")
 
     # Ensure models are loaded
     bm25_ready, vector_ready = _ensure_models()
     if not bm25_ready:
         print("[RAG] Warning: BM25 model not ready")
-        return []
+        return None
 
     try:
-        conn = sqlite3.connect(str(EMBEDDINGS_DB))
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        query_vecs = [None] * len(queries)
+        if vector_ready and _vector_model:
+            query_vecs = _vector_model.encode_queries(queries)
 
-        # Get all documents with their metadata
-        cursor.execute("SELECT id, content, source, metadata FROM embeddings ORDER BY id")
-        all_docs = cursor.fetchall()
-        conn.close()
+        if mode != "bm25" and any(query_vec is None for query_vec in query_vecs):
+            print(f"[RAG] Warning: Vector model not ready, {mode} retrieval falls back to BM25")
 
-        if not all_docs:
-            return []
+        ranked = [
+            _rank(query, query_vec, top_k, mode if query_vec is not None else "bm25", vector_ready)
+            for query, query_vec in zip(queries, query_vecs)
+        ]
+        rows = _fetch_rows({candidate[0] for candidates, _, _ in ranked for candidate in candidates[:top_k]})
+        return [_format_results(candidates, top_k, method, count, rows) for candidates, method, count in ranked]
 
-        # Calculate BM25 scores for all documents
-        candidate_scores = []
-        for doc in all_docs:
-            doc_idx = doc["id"] - 1  # SQLite IDs start at 1
-            bm25_score = _bm25_model.score(query, doc_idx)
-
-            # Only consider documents with non-zero BM25 scores
-            if bm25_score > 0:
-                vector_score = 0.0
-                if vector_ready and _vector_model:
-                    vector_score = _vector_model.cosine_similarity(query, doc_idx)
-
-                candidate_scores.append({
-                    "id": doc["id"],
-                    "content": doc["content"][:500] if doc["content"] else "",
-                    "source": doc["source"] if doc["source"] else "unknown",
-                    "metadata": json.loads(doc["metadata"]) if doc["metadata"] else {},
-                    "bm25_score": bm25_score,
-                    "vector_score": vector_score,
-                    "combined_score": bm25_score  # Primary score is BM25
-                })
-
-        # Sort by BM25 score primarily, then vector score for ties
-        candidate_scores.sort(key=lambda x: (x["bm25_score"], x["vector_score"]), reverse=True)
-
-        # Return top_k results
-        results = []
-        for i, candidate in enumerate(candidate_scores[:top_k]):
-            result = {
-                "id": candidate["id"],
-                "content": candidate["content"],
-                "source": candidate["source"],
-                "score": candidate["bm25_score"],  # Primary score for compatibility
-                "bm25_score": candidate["bm25_score"],
-                "vector_score": candidate["vector_score"],
-                "metadata": candidate["metadata"],
-                "rank_method": "bm25+vector_tiebreak" if vector_ready else "bm25_only"
+    except Exception as e:
+        # Graceful degradation - log error but don't crash
+        print(f"[RAG] Warning: Failed to retrieve: {e}")
+        return None
+
+def _rank(query: str, query_vec: Any, top_k: int, mode: str, vector_ready: bool,
+          bm25: Optional[BM25Scorer] = None) -> Tuple[List[Tuple[int, float, float, float]], str, int]:
+    """Rank one query against the loaded models.
+
+    Returns (candidates, rank_method, candidate_count) where candidates are
+    (doc_id, bm25_score, vector_score, score) in final order. bm25 defaults
+    to the loaded scorer (see BM25Scorer.with_stats for sharded scoring).
+    """
+    bm25 = bm25 or _bm25_model
+    vector = _vector_model
+    if bm25 is None:
+        raise RuntimeError("BM25 index not loaded")
+    if mode == "vector":
+        if vector is None:
+            raise RuntimeError("vector index not loaded")
+        neighbours = vector.search(query_vec, top_k)
+        bm25_scores = _bm25_scores_for(query, [doc_id for doc_id, _ in neighbours], bm25)
+        candidates = [
+            (doc_id, bm25_scores.get(doc_id, 0.0), vector_score, vector_score)
+            for doc_id, vector_score in neighbours
+        ]
+        method = "vector_ann" if vector.ann is not None else "vector_exact"
+        return candidates, method, len(candidates)
+
+    if mode == "hybrid":
+        return _rank_hybrid(query, query_vec, top_k, bm25)
+
+    # Score only documents that share a term with the query
+    hits = bm25.search(query, top_k)
+
+    # Score all hits against the query in one matrix product
+    vector_scores: Dict[int, float] = {}
+    if query_vec is not None and vector is not None:
+        hit_ids = [doc_id for doc_id, _ in hits]
+        vector_scores = vector.similarities(query_vec, hit_ids)
+        if not vector_scores and hit_ids and vector.embeddings is not None:
+            vector_scores = {
+                doc_id: vector.cosine_similarity(query, doc_id) for doc_id in hit_ids
             }
-            results.append(result)
 
-        return results
+    return _tiebreak(hits, vector_scores), "bm25+vector_tiebreak" if vector_ready else "bm25_only", len(hits)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Bounded thread pool shared by the async retrieval API"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, RAG_EXECUTOR_WORKERS), thread_name_prefix="rag")
+        return _executor
+
+async def aretrieve(query: str, top_k: int = 3, mode: str = "bm25") -> List[Dict[str, Any]]:
+    """Awaitable retrieve() that keeps SQLite, scoring and encoding off the event loop.
+
+    Work runs on a RAG_EXECUTOR_WORKERS thread pool; transformer encodes are
+    additionally capped by RAG_MAX_CONCURRENT_ENCODES. Cancelling the await
+    (e.g. on client disconnect) drops a retrieval that is still queued; one
+    already running finishes in its thread and its result is discarded.
+    """
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), retrieve, query, top_k, mode)
+
+async def aretrieve_many(queries: List[str], top_k: int = 3, mode: str = "bm25") -> List[List[Dict[str, Any]]]:
+    """Awaitable retrieve_many() on the same bounded executor as aretrieve()"""
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), retrieve_many, queries, top_k, mode)
+
+def _tiebreak(hits: List[Tuple[int, float]], vector_scores: Dict[int, float]) -> List[Tuple[int, float, float, float]]:
+    """Order (doc_id, bm25) hits by BM25, breaking ties by vector score.
+
+    Returns (doc_id, bm25_score, vector_score, score) candidates.
+    """
+    candidates = [
+        (doc_id, bm25_score, vector_scores.get(doc_id, 0.0), bm25_score) for doc_id, bm25_score in hits
+    ]
+    candidates.sort(key=lambda x: (x[1], x[2]), reverse=True)
+    return candidates
+
+def _hybrid_lists(query: str, query_vec: Any, depth: int, bm25: BM25Scorer) -> Tuple[
+        List[Tuple[int, float]], List[Tuple[int, float]], Dict[int, float], Dict[int, float]]:
+    """The top-depth BM25 and vector rankings plus both scores of every listed doc"""
+    vector = _vector_model
+    if vector is None:
+        raise RuntimeError("vector index not loaded")
+    bm25_scores = bm25._accumulate(query)
+    keyword = bm25.search(query, depth, scores=bm25_scores)[:depth]
+    semantic = vector.search(query_vec, depth)
+
+    vector_scores = dict(semantic)
+    missing = [doc_id for doc_id, _ in keyword if doc_id not in vector_scores]
+    vector_scores.update(vector.similarities(query_vec, missing))
+    return keyword, semantic, bm25_scores, vector_scores
+
+def _fuse(keyword: List[Tuple[int, float]], semantic: List[Tuple[int, float]], top_k: int,
+          bm25_scores: Dict[int, float], vector_scores: Dict[int, float]) -> Tuple[List[Tuple[int, float, float, float]], int]:
+    """Reciprocal-rank fusion of two rankings; returns (top_k candidates, fused set size)"""
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in (keyword, semantic):
+        for rank, (doc_id, _) in enumerate(ranking, 1):
+            fused[doc_id] += 1.0 / (RRF_K + rank)
+
+    ranked = heapq.nlargest(top_k, fused.items(), key=lambda item: item[1])
+    candidates = [
+        (doc_id, bm25_scores.get(doc_id, 0.0), vector_scores.get(doc_id, 0.0), rrf_score)
+        for doc_id, rrf_score in ranked
+    ]
+    return candidates, len(fused)
+
+def _rank_hybrid(query: str, query_vec: Any, top_k: int,
+                 bm25: Optional[BM25Scorer] = None) -> Tuple[List[Tuple[int, float, float, float]], str, int]:
+    """Fuse the top-N BM25 and top-N vector rankings with reciprocal-rank fusion.
+
+    Each list is bounded to max(top_k, RAG_HYBRID_CANDIDATES) so the work is
+    independent of how many documents merely share a term with the query.
+    """
+    bm25 = bm25 or _bm25_model
+    if bm25 is None:
+        raise RuntimeError("BM25 index not loaded")
+    depth = max(top_k, RAG_HYBRID_CANDIDATES)
+    keyword, semantic, bm25_scores, vector_scores = _hybrid_lists(query, query_vec, depth, bm25)
+    candidates, fused_count = _fuse(keyword, semantic, top_k, bm25_scores, vector_scores)
+    return candidates, "hybrid_rrf", fused_count
+
+def _shard_corpus_stats(queries: List[str]) -> Optional[Tuple[Optional[int], int, int, Dict[str, int]]]:
+    """Shard side of a sharded retrieve: (generation, N, total_len, {term: df}) for the query terms.
+
+    generation is None while a rebuild still serves an older index. Returns
+    None when this shard's index can't be loaded.
+    """
+    if not _ensure_models()[0] or _bm25_model is None:
+        return None
+    bm25 = _bm25_model
+    generation = _corpus_generation()
+    doc_freqs = {
+        token: bm25.doc_freqs.get(token, 0)
+        for query in queries for token, _ in _query_terms(query)
+    }
+    serving = generation if _index_generation == generation else None
+    return serving, bm25.N, bm25.total_len, doc_freqs
+
+def _shard_rank(queries: List[str], top_k: int, mode: str,
+                stats: Tuple[int, int, Dict[str, int]]) -> Optional[List[Tuple[list, str, int]]]:
+    """Shard side of a sharded retrieve: rank against corpus-wide BM25 statistics.
+
+    stats is (N, total_len, {term: df}) summed over every shard, so BM25
+    scores are comparable between shards. Returns (candidates, rank_method,
+    candidate_count) per query; hybrid candidates are this shard's whole
+    keyword + vector lists, unfused, for merge_shard_rankings() to fuse.
+    Always ranks on the in-memory index, since FTS5's bm25() can't take
+    outside statistics.
+    """
+    bm25_ready, vector_ready = _ensure_models()
+    if not bm25_ready or _bm25_model is None:
+        return None
+    bm25 = _bm25_model.with_stats(*stats)
+    query_vecs = [None] * len(queries)
+    if vector_ready and _vector_model:
+        query_vecs = _vector_model.encode_queries(queries)
+
+    ranked = []
+    for query, query_vec in zip(queries, query_vecs):
+        if mode == "hybrid" and query_vec is not None:
+            depth = max(top_k, RAG_HYBRID_CANDIDATES)
+            keyword, semantic, bm25_scores, vector_scores = _hybrid_lists(query, query_vec, depth, bm25)
+            listed = dict.fromkeys(doc_id for doc_id, _ in keyword + semantic)
+            candidates = [
+                (doc_id, bm25_scores.get(doc_id, 0.0), vector_scores.get(doc_id, 0.0), 0.0) for doc_id in listed
+            ]
+            ranked.append((candidates, "hybrid_rrf", len(candidates)))
+        else:
+            ranked.append(_rank(query, query_vec, top_k, mode if query_vec is not None else "bm25",
+                                vector_ready, bm25))
+    return ranked
+
+def merge_shard_rankings(rankings: List[Tuple[list, str, int]], top_k: int) -> Tuple[list, str, int]:
+    """Merge per-shard _shard_rank() output for one query into one global ranking.
+
+    Candidate ids must already be global. BM25 scores were computed with
+    corpus-wide statistics and cosine similarities don't depend on the
+    corpus, so both compare across shards; hybrid RRF is recomputed over the
+    merged keyword and vector lists rather than summed per shard.
+    """
+    rankings = [ranking for ranking in rankings if ranking[0]]
+    if not rankings:
+        return [], "bm25_only", 0
+    method = rankings[0][1]
+    candidates = [candidate for ranked, _, _ in rankings for candidate in ranked]
+    count = sum(count for _, _, count in rankings)
+
+    if method == "hybrid_rrf":
+        depth = max(top_k, RAG_HYBRID_CANDIDATES)
+        keyword = heapq.nlargest(depth, [(c[0], c[1]) for c in candidates if c[1] > 0], key=lambda item: item[1])
+        semantic = heapq.nlargest(depth, [(c[0], c[2]) for c in candidates], key=lambda item: item[1])
+        bm25_scores = {c[0]: c[1] for c in candidates}
+        vector_scores = {c[0]: c[2] for c in candidates}
+        fused, count = _fuse(keyword, semantic, top_k, bm25_scores, vector_scores)
+        return fused, method, count
+    if method.startswith("vector"):
+        return heapq.nlargest(top_k, candidates, key=lambda c: c[2]), method, count
+    return heapq.nlargest(top_k, candidates, key=lambda c: (c[1], c[2])), method, count
+
+def _build_results(candidates: List[Tuple[int, float, float, float]], top_k: int,
+                   rank_method: str, candidate_count: int) -> List[Dict[str, Any]]:
+    """Load the rows for the first top_k ranked (doc_id, bm25, vector, score) candidates.
+
+    candidate_count (the size of the set the ranking was drawn from) is
+    reported on every result for tuning.
+    """
+    rows = _fetch_rows([candidate[0] for candidate in candidates[:top_k]])
+    return _format_results(candidates, top_k, rank_method, candidate_count, rows)
+
+def _bm25_scores_for(query: str, doc_ids: List[int], bm25: Optional[BM25Scorer] = None) -> Dict[int, float]:
+    """BM25 of just the given documents, from their stored term stats.
+
+    Costs O(len(doc_ids)) instead of a scan of every matching posting;
+    rows without stored stats fall back to the inverted index.
+    """
+    if not doc_ids:
+        return {}
+    placeholders = ",".join("?" for _ in doc_ids)
+    stored = _connect().execute(
+        f"SELECT id, terms FROM term_freqs WHERE id IN ({placeholders})", doc_ids
+    ).fetchall()
+    bm25 = bm25 or _bm25_model
+    if bm25 is None:
+        return {}
+    scores = {doc_id: bm25.score_counts(query, doc_id, json.loads(terms)) for doc_id, terms in stored}
+    for doc_id in doc_ids:
+        if doc_id not in scores:
+            scores[doc_id] = bm25.score(query, doc_id)
+    return scores
+
+def _fetch_rows(doc_ids: Iterable[int]) -> Dict[int, Tuple[str, Optional[str], Optional[str]]]:
+    """Fetch (content, source, metadata) for just the winning rows, in one IN (...) query.
+
+    Content is cut to RESULT_CONTENT_CHARS by SQLite, so long snippets are
+    never decoded in full; metadata stays a JSON string until formatting.
+    """
+    doc_ids = list(doc_ids)
+    if not doc_ids:
+        return {}
+    placeholders = ",".join("?" for _ in doc_ids)
+    rows = _connect().execute(
+        f"SELECT id, substr(content, 1, ?), source, metadata FROM embeddings WHERE id IN ({placeholders})",
+        [RESULT_CONTENT_CHARS] + doc_ids
+    ).fetchall()
+    return {doc_id: (content, source, metadata) for doc_id, content, source, metadata in rows}
+
+def _format_results(candidates: List[Tuple[int, float, float, float]], top_k: int, rank_method: str,
+                    candidate_count: int, rows: Dict[int, Tuple]) -> List[Dict[str, Any]]:
+    """Turn the first top_k ranked candidates into result dicts using fetched rows"""
+    results = []
+    for doc_id, bm25_score, vector_score, score in candidates[:top_k]:
+        doc = rows.get(doc_id)
+        if doc is None:
+            continue
+        content, source, metadata = doc
+        result = {
+            "id": doc_id,
+            "content": content or "",
+            "source": source or "unknown",
+            "score": score,  # Primary score for compatibility
+            "bm25_score": bm25_score,
+            "vector_score": vector_score,
+            "metadata": json.loads(metadata) if metadata else {},
+            "rank_method": rank_method,
+            "candidate_count": candidate_count
+        }
+        results.append(result)
+
+    return results
+
+def ann_recall(queries: List[str], k: int = 10) -> Optional[float]:
+    """Recall@k of the IVF index against brute-force vector search.
+
+    Returns None when no vector index is loaded; 1.0 when the corpus is
+    small enough that search is exact anyway.
+    """
+    _, vector_ready = _ensure_models()
+    if not vector_ready or _vector_model is None or _vector_model.embeddings is None:
+        return None
+    approx, exact = [], []
+    for query in queries:
+        query_vec = _vector_model.encode_query(query)
+        if query_vec is None:
+            continue
+        approx.append([doc_id for doc_id, _ in _vector_model.search(query_vec, k)])
+        exact.append([doc_id for doc_id, _ in _vector_model.search(query_vec, k, exact=True)])
+    return recall_at_k(approx, exact)
+
+def quantization_report(queries: List[str], k: int = 10,
+                        dtypes: Tuple[str, ...] = ("float16", "int8")) -> Optional[Dict[str, Any]]:
+    """Accuracy of quantized vector scoring against the loaded float matrix.
+
+    For each dtype: recall@k of its top-k against the float top-k, mean and
+    max absolute cosine error, and bytes per stored row. Returns None when
+    no vector index is loaded. If the store is itself quantized the baseline
+    is its decoded values, reported under "baseline".
+    """
+    _, vector_ready = _ensure_models()
+    if not vector_ready or _vector_model is None or _vector_model.embeddings is None:
+        return None
+    stored = _vector_model.embeddings
+    baseline = stored[:] if isinstance(stored, QuantizedMatrix) else np.asarray(stored, dtype=np.float32)
+    query_vecs = [vec for vec in (_vector_model.encode_query(q) for q in queries) if vec is not None]
+    if not query_vecs or len(baseline) == 0:
+        return None
+    k = min(k, len(baseline))
+
+    def top(scores: Any) -> List[int]:
+        return np.argsort(-scores, kind="stable")[:k].tolist()
+
+    report = {"baseline": {
+        "dtype": stored.dtype if isinstance(stored, QuantizedMatrix) else "float32",
+        "rows": len(baseline),
+        "bytes_per_row": baseline.shape[1] * 4,
+    }}
+    for dtype in dtypes:
+        packed = QuantizedMatrix.from_float(baseline, dtype)
+        approx, exact, errors = [], [], []
+        for query_vec in query_vecs:
+            reference = baseline @ query_vec
+            scores = packed.dot(query_vec)
+            exact.append(top(reference))
+            approx.append(top(scores))
+            errors.append(np.abs(scores - reference))
+        errors = np.concatenate(errors)
+        report[dtype] = {
+            "recall_at_k": round(recall_at_k(approx, exact), 4),
+            "mean_abs_error": float(errors.mean()),
+            "max_abs_error": float(errors.max()),
+            "bytes_per_row": packed.nbytes / len(packed),
+        }
+    return report
+
+def _ensure_fts(conn: sqlite3.Connection) -> bool:
+    """Create the FTS5 mirror of the snippet table (plus sync triggers) if missing.
+
+    Returns False when this SQLite build has no FTS5 support.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings_fts'")
+    if cursor.fetchone():
+        return True
+    try:
+        cursor.execute("""
+            CREATE VIRTUAL TABLE embeddings_fts USING fts5(
+                content, content='embeddings', content_rowid='id'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"[RAG] Warning: FTS5 unavailable: {e}")
+        return False
+
+    # External-content table: triggers keep it in sync with embeddings
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS embeddings_fts_ai AFTER INSERT ON embeddings BEGIN
+            INSERT INTO embeddings_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS embeddings_fts_ad AFTER DELETE ON embeddings BEGIN
+            INSERT INTO embeddings_fts(embeddings_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS embeddings_fts_au AFTER UPDATE OF content ON embeddings BEGIN
+            INSERT INTO embeddings_fts(embeddings_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO embeddings_fts(rowid, content) VALUES (new.id, new.content);
+        END
+    """)
+    cursor.execute("INSERT INTO embeddings_fts(embeddings_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
 
+def _stored_similarities(conn: sqlite3.Connection, query: str, doc_ids: List[int]) -> Dict[int, float]:
+    """Cosine similarity against the stored BLOBs of just the given rows"""
+    model = _storage_model()
+    if model is None or not doc_ids:
+        return {}
+    try:
+        query_vec = np.asarray(_encode(model, [query])[0], dtype=np.float32)
+        norm = np.linalg.norm(query_vec)
+        if norm == 0:
+            return {}
+        query_vec /= norm
+
+        placeholders = ",".join("?" for _ in doc_ids)
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT id, vector_embedding FROM embeddings WHERE id IN ({placeholders}) "
+            "AND vector_embedding IS NOT NULL",
+            doc_ids
+        )
+        decoded = [(doc_id, _decode_blob(blob, len(query_vec))) for doc_id, blob in cursor.fetchall()]
+        decoded = [(doc_id, vec) for doc_id, vec in decoded if vec is not None]
+        if not decoded:
+            return {}
+        matrix = _normalize_rows(np.stack([vec for _, vec in decoded]))
+        return {doc_id: float(score) for (doc_id, _), score in zip(decoded, matrix @ query_vec)}
     except Exception as e:
-        # Graceful degradation - log error but don't crash
-        print(f"[RAG] Warning: Failed to retrieve: {e}")
+        print(f"[RAG] Warning: Vector similarity failed: {e}")
+        return {}
+
+def _retrieve_fts5(query: str, top_k: int) -> Optional[List[Dict[str, Any]]]:
+    """FTS5 backend: bm25() candidate generation + stored-vector tie-break.
+
+    Returns None when FTS5 is unavailable so the caller can fall back.
+    """
+    terms = _tokenize(query)
+    if not terms:
         return []
 
+    conn = _connect()
+    if not _ensure_fts(conn):
+        return None
+
+    # FTS5's bm25() is negative (lower is better); negate for our scale
+    match = " OR ".join(f'"{term}"' for term in dict.fromkeys(terms))
+    candidates = conn.execute("""
+        SELECT rowid, -bm25(embeddings_fts) FROM embeddings_fts
+        WHERE embeddings_fts MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    """, (match, max(top_k, 1) * FTS5_CANDIDATE_FACTOR)).fetchall()
+    if not candidates:
+        return []
+
+    # Keep the top_k plus anything tied with the cutoff for the tie-break
+    cutoff = candidates[min(top_k, len(candidates)) - 1][1]
+    hits = [(doc_id, score) for doc_id, score in candidates if score >= cutoff]
+
+    vector_scores = _stored_similarities(conn, query, [doc_id for doc_id, _ in hits])
+    return _build_results(_tiebreak(hits, vector_scores), top_k,
+                          "fts5_bm25+vector_tiebreak" if vector_scores else "fts5_bm25", len(hits))
+
 def retrieve_legacy(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
     """
     Legacy keyword-based retrieval for comparison.
@@ -263,11 +2005,12 @@ def retrieve_legacy(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
     """
     if not available():
         return []
+    if RAG_SHARDS > 1:
+        return _shards().retrieve_legacy(query, top_k)
 
     try:
-        conn = sqlite3.connect(str(EMBEDDINGS_DB))
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        cursor = _connect().cursor()
+        cursor.row_factory = sqlite3.Row
 
         # Simple keyword-based retrieval
         query_lower = query.lower()
@@ -299,7 +2042,6 @@ def retrieve_legacy(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
                 "rank_method": "keyword_match"
             })
 
-        conn.close()
         return results
 
     except Exception as e:
@@ -327,78 +2069,90 @@ def enrich_prompt(base_prompt: str, context_query: str, max_snippets: int = 3) -
     enriched = f"{context_block}\n## Your Task\n{base_prompt}"
     return enriched
 
-def init_db():
-    """Initialize embeddings database with enhanced schema (idempotent)"""
-    EMBEDDINGS_DB.parent.mkdir(parents=True, exist_ok=True)
+def init_db() -> None:
+    """Initialize embeddings database with enhanced schema (idempotent)
 
-    conn = sqlite3.connect(str(EMBEDDINGS_DB))
-    cursor = conn.cursor()
+    The schema itself is created by _migrate() when the first pooled
+    connection opens the DB.
+    """
+    if RAG_SHARDS > 1:
+        _shards().init_db()
+        return
+    conn = _connect()
+    if RAG_BACKEND == "fts5":
+        _ensure_fts(conn)
+
+def _storage_model() -> Any:
+    """Sentence transformer used for stored embeddings (the registry's shared instance)"""
+    return get_model()
+
+def _encode_for_storage(contents: List[str]) -> List[Optional[bytes]]:
+    """Encode snippet texts in one batch into storage BLOBs (None if unavailable)"""
+    if not contents or not (_pool_enabled(len(contents)) or _storage_model() is not None):
+        return [None] * len(contents)
+    try:
+        embeddings = _bulk_encode(contents)
+        return [_encode_blob(embedding) for embedding in embeddings]
+    except Exception as e:
+        print(f"[RAG] Warning: Failed to generate embedding: {e}")
+        return [None] * len(contents)
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS embeddings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            content TEXT NOT NULL,
-            source TEXT,
-            metadata TEXT,
-            vector_embedding BLOB,  -- Store as BLOB for efficiency
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
+def _pad_snippet(item: Tuple[Any, ...]) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+    """(content, source, metadata) with missing trailing fields set to None"""
+    content, source, metadata = tuple(item) + (None,) * (3 - len(item))
+    return content, source, metadata
 
-    # Create indexes for faster search
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_content
-        ON embeddings(content)
-    """)
+def add_snippets(snippets: List[Tuple[str, Optional[str], Optional[Dict[str, Any]]]]) -> List[int]:
+    """Add (content, source, metadata) snippets in a single transaction.
 
-    cursor.execute("""
-        CREATE INDEX IF NOT EXISTS idx_source
-        ON embeddings(source)
-    """)
+    Embeddings are computed in one batch, the generation counter is bumped
+    once per row (by trigger), and a loaded index is updated in place instead of being
+    thrown away. With RAG_SHARDS > 1 every shard commits its own part and
+    the returned ids are global (see utils.rag_shards).
+    """
+    if not snippets:
+        return []
+    if RAG_SHARDS > 1:
+        return _shards().add_snippets(snippets)
 
-    conn.commit()
-    conn.close()
+    snippets = [_pad_snippet(item) for item in snippets]
+    blobs = _encode_for_storage([content for content, _, _ in snippets])
 
-def add_snippet(content: str, source: str = None, metadata: Dict[str, Any] = None) -> int:
+    conn = _connect()  # creates and migrates the DB on first use
+    if RAG_BACKEND == "fts5":
+        _ensure_fts(conn)
+    _check_tokenizer(conn)
+    with conn:  # one transaction; rolled back on error
+        cursor = conn.cursor()
+        rows: List[Tuple[int, Dict[str, int], Optional[bytes]]] = []
+        for (content, source, metadata), vector_blob in zip(snippets, blobs):
+            cursor.execute("""
+                INSERT INTO embeddings (content, source, metadata, vector_embedding)
+                VALUES (?, ?, ?, ?)
+            """, (content, source, json.dumps(metadata) if metadata else None, vector_blob))
+            doc_id, counts = cursor.lastrowid, _term_counts(content)
+            assert doc_id is not None  # set by the INSERT above
+            cursor.execute("INSERT INTO term_freqs (id, terms) VALUES (?, ?)", (doc_id, json.dumps(counts)))
+            rows.append((doc_id, counts, vector_blob))
+        # The generation_ai trigger bumped the generation once per row
+        generation = cursor.execute("SELECT value FROM rag_meta WHERE key = 'generation'").fetchall()[0][0]
+
+    # Patch the loaded index if nobody else wrote in between; otherwise the
+    # next _ensure_models() catches up from the DB
+    global _index_generation
+    with _index_lock:
+        if _bm25_model is not None and _index_generation == generation - len(rows):
+            _apply_rows(_bm25_model, _vector_model, rows)
+            _index_generation = generation
+            _maybe_compact()
+
+    return [doc_id for doc_id, _, _ in rows]
+
+def add_snippet(content: str, source: Optional[str] = None, metadata: Optional[Dict[str, Any]] = None) -> int:
     """Add a snippet to the embeddings database with optional vector embedding"""
-    init_db()  # Ensure DB exists
-
-    conn = sqlite3.connect(str(EMBEDDINGS_DB))
-    cursor = conn.cursor()
-
-    # Calculate vector embedding if available
-    vector_blob = None
-    if VECTOR_AVAILABLE:
-        try:
-            from sentence_transformers import SentenceTransformer
-            import numpy as np
-
-            # Lazy load model to avoid overhead if not needed
-            if not hasattr(add_snippet, '_vector_model'):
-                add_snippet._vector_model = SentenceTransformer(VECTOR_MODEL)
-
-            embedding = add_snippet._vector_model.encode([content], show_progress_bar=False)[0]
-            vector_blob = embedding.astype(np.float32).tobytes()
-        except Exception as e:
-            print(f"[RAG] Warning: Failed to generate embedding: {e}")
-
-    cursor.execute("""
-        INSERT INTO embeddings (content, source, metadata, vector_embedding)
-        VALUES (?, ?, ?, ?)
-    """, (content, source, json.dumps(metadata) if metadata else None, vector_blob))
-
-    conn.commit()
-    snippet_id = cursor.lastrowid
-    conn.close()
-
-    # Clear cached models to force retraining with new data
-    global _bm25_model, _vector_model
-    _bm25_model = None
-    _vector_model = None
-
-    return snippet_id
+    return add_snippets([(content, source, metadata)])[0]
 
-def add_test_snippets():
+def add_test_snippets() -> None:
     """Add test snippets to bootstrap the RAG system"""
     test_snippets = [
         ("The Spiral Codex uses glyph-based routing with symbols like ⊕⊡⊠⊨⊚", "README.md", {"type": "architecture"}),
@@ -417,8 +2171,24 @@ def add_test_snippets():
         snippet_id = add_snippet(content, source, metadata)
         print(f"Added test snippet #{snippet_id}: {source}")
 
-def reset_models():
-    """Reset cached models to force retraining"""
-    global _bm25_model, _vector_model
-    _bm25_model = None
-    _vector_model = None
+def reset_models() -> None:
+    """Reset cached models to force reloading from the index artifact"""
+    global _bm25_model, _vector_model, _index_generation, _index_max_id, _adds_since_compaction, _index_epoch
+    global _shard_store, _persisted_state
+    with _index_lock:
+        if _shard_store is not None:
+            _shard_store.close()  # workers hold their shard's models
+            _shard_store = None
+        _index_epoch += 1  # a rebuild still in flight will not be swapped in
+        _bm25_model = None
+        _vector_model = None
+        _index_generation = None
+        _index_max_id = 0
+        _adds_since_compaction = 0
+    wait_for_rebuild()  # don't let an orphaned build write into a reset index dir
+    _persisted_state = None
+    with _model_registry_lock:
+        for key in [key for key, model in _model_registry.items() if model is None]:
+            del _model_registry[key]  # retry failed loads
+    _result_cache.clear()
+    close_connections()
@@ -0,0 +1,213 @@
+# utils/rag_shards.py
+"""
+Sharded snippet store for Spiral Codex RAG
+Snippets are partitioned over N SQLite files (by source or by content hash).
+Each shard is owned by its own worker process, which keeps only that shard's
+BM25/vector index in memory and serves it through the regular utils.rag code.
+Queries fan out to every shard concurrently: the shards first report their
+BM25 statistics for the query terms, then rank with the summed (corpus-wide)
+statistics, and the per-shard candidate lists are merged with a global top-k
+heap (hybrid RRF is recomputed over the merged lists). Only the winning rows
+are fetched.
+"""
+import multiprocessing
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+SHARD_KEYS = ("hash", "source")
+
+Snippet = Tuple[str, Optional[str], Optional[Dict[str, Any]]]
+
+def _padded(item: Sequence[Any]) -> Snippet:
+    """(content, source, metadata) with missing trailing fields set to None"""
+    content, source, metadata = tuple(item) + (None,) * (3 - len(item))
+    return content, source, metadata
+
+def shard_paths(base: Path, num_shards: int) -> List[Path]:
+    """DB path of every shard, next to the unsharded DB (embeddings.shard0.sqlite, ...)"""
+    base = Path(base)
+    return [base.with_name(f"{base.stem}.shard{i}{base.suffix}") for i in range(num_shards)]
+
+def _init_worker(db_path: str, shard: int, settings: Dict[str, Any]) -> None:
+    """Point this worker's utils.rag at a single shard, with the parent's settings"""
+    import utils.rag as rag
+
+    for name, value in settings.items():
+        setattr(rag, name, value)
+    override = os.environ.get("RAG_INDEX_DIR")
+    if override:
+        os.environ["RAG_INDEX_DIR"] = str(Path(override) / f"shard{shard}")
+    rag.EMBEDDINGS_DB = Path(db_path)
+    rag.RAG_SHARDS = 1
+
+def _call(name: str, *args: Any) -> Any:
+    """Run a utils.rag function inside a shard worker"""
+    import utils.rag as rag
+    return getattr(rag, name)(*args)
+
+class ShardedStore:
+    """N shard DBs, each served by a dedicated single-process pool.
+
+    Snippet ids are made global as local_id * num_shards + shard, so an id
+    returned by add_snippets() matches the "id" of a later retrieve() result.
+    Each shard keeps its own BM25 statistics; retrieval scores with their
+    sum, so results rank the same as in one unsharded index.
+    """
+
+    def __init__(self, base_path: Path, num_shards: int, key: str = "hash",
+                 settings: Optional[Dict[str, Any]] = None) -> None:
+        if num_shards < 1:
+            raise ValueError("num_shards must be >= 1")
+        if key not in SHARD_KEYS:
+            raise ValueError(f"Unknown shard key {key!r}; expected one of {SHARD_KEYS}")
+        self.base_path = Path(base_path)
+        self.num_shards = num_shards
+        self.key = key
+        self.paths = shard_paths(self.base_path, num_shards)
+        # spawn: workers must not inherit the parent's threads, locks or connections
+        context = multiprocessing.get_context("spawn")
+        self._workers = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context,
+                                initializer=_init_worker, initargs=(str(path), shard, settings or {}))
+            for shard, path in enumerate(self.paths)
+        ]
+
+    def shard_of(self, content: str, source: Optional[str]) -> int:
+        """Shard a snippet belongs to"""
+        value = (source or "") if self.key == "source" else content
+        return zlib.crc32(value.encode("utf-8")) % self.num_shards
+
+    def global_id(self, shard: int, doc_id: int) -> int:
+        return doc_id * self.num_shards + shard
+
+    def _existing(self) -> List[int]:
+        """Shards whose DB has been created"""
+        return [shard for shard, path in enumerate(self.paths) if path.exists()]
+
+    def _fan_out(self, name: str, *args: Any, shards: Optional[Iterable[int]] = None) -> Dict[int, Any]:
+        """Call name(*args) on the given shards concurrently; failed shards are left out"""
+        shards = range(self.num_shards) if shards is None else shards
+        return self._fan_out_each(name, {shard: args for shard in shards})
+
+    def _fan_out_each(self, name: str, args: Dict[int, tuple]) -> Dict[int, Any]:
+        """Call name(*args[shard]) on each listed shard concurrently; failed shards are left out"""
+        futures = {shard: self._workers[shard].submit(_call, name, *shard_args) for shard, shard_args in args.items()}
+        results = {}
+        for shard, future in futures.items():
+            try:
+                results[shard] = future.result()
+            except Exception as e:
+                print(f"[RAG] Warning: Shard {shard} failed in {name}: {e}")
+        return results
+
+    def init_db(self) -> None:
+        self._fan_out("init_db")
+
+    def add_snippets(self, snippets: List[Snippet]) -> List[int]:
+        """Route snippets to their shards (one transaction per shard); returns global ids in input order"""
+        snippets = [_padded(item) for item in snippets]
+        groups: Dict[int, List[int]] = {}
+        for i, (content, source, _) in enumerate(snippets):
+            groups.setdefault(self.shard_of(content, source), []).append(i)
+        futures = {
+            shard: self._workers[shard].submit(_call, "add_snippets", [snippets[i] for i in indices])
+            for shard, indices in groups.items()
+        }
+        ids = [0] * len(snippets)
+        for shard, future in futures.items():
+            for i, doc_id in zip(groups[shard], future.result()):
+                ids[i] = self.global_id(shard, doc_id)
+        return ids
+
+    def corpus_stats(self, queries: List[str]) -> Tuple[Optional[tuple], Optional[Tuple[int, int, Dict[str, int]]]]:
+        """BM25 statistics for the query terms summed over every shard.
+
+        Returns (generation, (N, total_len, {term: df})). generation is the
+        tuple of shard generations, usable as a cache key, or None while a
+        shard is still serving an older index; stats is None when no shard
+        could answer.
+        """
+        states = self._fan_out("_shard_corpus_stats", queries, shards=self._existing())
+        states = {shard: state for shard, state in sorted(states.items()) if state is not None}
+        if not states:
+            return None, None
+        doc_freqs: Dict[str, int] = {}
+        for _, _, _, shard_freqs in states.values():
+            for token, freq in shard_freqs.items():
+                doc_freqs[token] = doc_freqs.get(token, 0) + freq
+        stats = (sum(state[1] for state in states.values()), sum(state[2] for state in states.values()), doc_freqs)
+        generation: Optional[tuple] = tuple((shard, state[0]) for shard, state in states.items())
+        if any(state[0] is None for state in states.values()):
+            generation = None
+        return generation, stats
+
+    def retrieve_many(self, queries: List[str], top_k: int, mode: str,
+                      stats: Tuple[int, int, Dict[str, int]]) -> List[List[Dict[str, Any]]]:
+        """Rank the batch on every shard with corpus-wide stats and keep the global top_k per query"""
+        import utils.rag as rag
+
+        per_shard = self._fan_out("_shard_rank", queries, top_k, mode, stats, shards=self._existing())
+        per_shard = {shard: ranked for shard, ranked in per_shard.items() if ranked is not None}
+        merged = []
+        for q in range(len(queries)):
+            rankings = [
+                ([(self.global_id(shard, doc_id),) + tuple(rest) for doc_id, *rest in candidates], method, count)
+                for shard, ranked in per_shard.items()
+                for candidates, method, count in [ranked[q]]
+            ]
+            merged.append(rag.merge_shard_rankings(rankings, top_k))
+
+        # Fetch only the winning rows, one query per shard
+        wanted: Dict[int, set] = {}
+        for candidates, _, _ in merged:
+            for doc_id, *_ in candidates[:top_k]:
+                wanted.setdefault(doc_id % self.num_shards, set()).add(doc_id // self.num_shards)
+        fetched = self._fan_out_each("_fetch_rows", {shard: (sorted(ids),) for shard, ids in wanted.items()})
+        rows = {
+            self.global_id(shard, doc_id): row
+            for shard, shard_rows in fetched.items() for doc_id, row in shard_rows.items()
+        }
+
+        results = []
+        for candidates, method, count in merged:
+            formatted = rag._format_results(candidates, top_k, method, count, rows)
+            for result in formatted:
+                result["shard"] = result["id"] % self.num_shards
+            results.append(formatted)
+        return results
+
+    def retrieve_legacy(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        """Keyword matches from every shard, highest global id first.
+
+        Each shard returns its own newest top_k; global ids interleave the
+        shards, so the merged order only approximates insertion order.
+        """
+        per_shard = self._fan_out("retrieve_legacy", query, top_k, shards=self._existing())
+        results = [
+            dict(result, id=self.global_id(shard, result["id"]), shard=shard)
+            for shard, shard_results in per_shard.items() for result in shard_results
+        ]
+        results.sort(key=lambda result: result["id"], reverse=True)
+        return results[:top_k]
+
+    def warm_up(self) -> bool:
+        """Load every existing shard's index in its worker; True when all of them loaded"""
+        shards = self._existing()
+        ready = self._fan_out("_ensure_models", shards=shards)
+        return bool(shards) and all(ready.get(shard, (False,))[0] for shard in shards)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Generation and max id of every shard"""
+        states = self._fan_out("_corpus_state", shards=self._existing())
+        return [
+            {"shard": shard, "path": str(path), "generation": states.get(shard, (0, 0))[0],
+             "max_id": states.get(shard, (0, 0))[1]}
+            for shard, path in enumerate(self.paths)
+        ]
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.shutdown(wait=True)
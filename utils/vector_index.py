@@ -0,0 +1,249 @@
+# utils/vector_index.py
+"""
+Approximate nearest-neighbour search for Spiral Codex RAG embeddings
+Inverted-file (IVF) index built with NumPy only: spherical k-means centroids
+partition the L2-normalized vectors into lists, and a query scans only the
+nprobe lists whose centroids are closest to it.
+
+QuantizedMatrix stores the same vectors as int8 (one float32 scale per row)
+or float16, and scores queries against the compact codes directly.
+"""
+import math
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+STORAGE_DTYPES = ("float32", "float16", "int8")
+
+class QuantizedMatrix:
+    """Embedding rows held as int8 codes with per-row scales, or as float16.
+
+    Row r decodes to codes[r] * scales[r] (scales is None for float16).
+    Indexing returns decoded float32 rows, so code written against a plain
+    ndarray (IVF training, per-row fallbacks) keeps working; dot() is the
+    scoring path and never materializes more than one float32 chunk.
+    """
+
+    def __init__(self, codes: np.ndarray, scales: Optional[np.ndarray] = None) -> None:
+        self.codes = codes
+        self.scales = scales
+
+    @property
+    def dtype(self) -> str:
+        return "int8" if self.scales is not None else "float16"
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.codes.shape
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @classmethod
+    def empty(cls, n: int, dim: int, dtype: str) -> "QuantizedMatrix":
+        if dtype == "int8":
+            return cls(np.zeros((n, dim), dtype=np.int8), np.zeros(n, dtype=np.float32))
+        if dtype == "float16":
+            return cls(np.zeros((n, dim), dtype=np.float16))
+        raise ValueError(f"unsupported quantized dtype {dtype!r}")
+
+    @classmethod
+    def from_float(cls, matrix: Any, dtype: str) -> "QuantizedMatrix":
+        """Quantize a float matrix (symmetric per-row scaling for int8)"""
+        matrix = np.asarray(matrix, dtype=np.float32)
+        quantized = cls.empty(len(matrix), matrix.shape[1], dtype)
+        quantized[:] = matrix
+        return quantized
+
+    def __setitem__(self, key: Any, values: Any) -> None:
+        values = np.asarray(values, dtype=np.float32)
+        if self.scales is None:
+            self.codes[key] = values.astype(np.float16)
+            return
+        block = np.atleast_2d(values)
+        scales = np.abs(block).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(block / scales[:, None]), -127, 127).astype(np.int8)
+        if values.ndim == 1:
+            codes, scales = codes[0], scales[0]
+        self.codes[key] = codes
+        self.scales[key] = scales
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        block = np.asarray(self.codes[key], dtype=np.float32)
+        if self.scales is None:
+            return block
+        scales = np.asarray(self.scales[key], dtype=np.float32)
+        return block * (scales[..., None] if block.ndim == 2 else scales)
+
+    def head(self, n: int) -> "QuantizedMatrix":
+        """View of the first n rows"""
+        return QuantizedMatrix(self.codes[:n], self.scales[:n] if self.scales is not None else None)
+
+    def resized(self, capacity: int) -> "QuantizedMatrix":
+        """Copy into a larger buffer without re-quantizing existing rows"""
+        grown = QuantizedMatrix.empty(capacity, self.shape[1], self.dtype)
+        grown.codes[:len(self)] = self.codes
+        if self.scales is not None and grown.scales is not None:
+            grown.scales[:len(self)] = self.scales
+        return grown
+
+    def dot(self, query_vec: np.ndarray, rows: Optional[np.ndarray] = None,
+            chunk_size: int = 65536) -> np.ndarray:
+        """Inner products of a float32 query with the given rows (all by default)"""
+        codes = self.codes if rows is None else self.codes[rows]
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), chunk_size):
+            chunk = np.asarray(codes[start:start + chunk_size], dtype=np.float32)
+            scores[start:start + chunk_size] = chunk @ query_vec
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+def inner_products(matrix: Union[np.ndarray, QuantizedMatrix], query_vec: np.ndarray,
+                   rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Scores of query_vec against a float ndarray or QuantizedMatrix"""
+    if isinstance(matrix, QuantizedMatrix):
+        return matrix.dot(query_vec, rows)
+    block = matrix if rows is None else matrix[rows]
+    return np.asarray(block @ query_vec, dtype=np.float32)
+
+class IVFIndex:
+    """IVF index over the rows of an external, L2-normalized float matrix.
+
+    The index stores row numbers only; callers pass the matrix to search(),
+    so the same (possibly memory-mapped) embeddings back both exact and
+    approximate scoring.
+    """
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray) -> None:
+        self.centroids = centroids  # (nlist, dim) unit-length centroids
+        self.order = order  # row numbers grouped by list
+        self.offsets = offsets  # (nlist + 1,) start of each list in order
+        self.extra: Dict[int, List[int]] = defaultdict(list)  # rows added since build
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, matrix: Any, nlist: Optional[int] = None, iterations: int = 10,
+              sample_size: Optional[int] = None, seed: int = 0) -> "IVFIndex":
+        """Train centroids on a sample of rows and assign every row to a list"""
+        n = len(matrix)
+        if n == 0:
+            raise ValueError("cannot build an IVF index over zero rows")
+        if not nlist:
+            nlist = int(math.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        sample_size = sample_size or min(n, 64 * nlist)
+
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(n, size=min(sample_size, n), replace=False))
+        sample = np.asarray(matrix[sample_rows], dtype=np.float32)
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # Re-seed empty lists from random sample rows
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        return cls(centroids, *_assign_all(centroids, matrix))
+
+    def add(self, row: int, vector: Any) -> None:
+        """Route one newly appended matrix row to its nearest list"""
+        list_id = int(np.argmax(self.centroids @ np.asarray(vector, dtype=np.float32)))
+        self.extra[list_id].append(row)
+
+    def candidate_rows(self, query_vec: np.ndarray, nprobe: int) -> np.ndarray:
+        """Row numbers stored in the nprobe lists closest to the query"""
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = self.centroids @ query_vec
+        if nprobe < self.nlist:
+            probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        else:
+            probes = np.arange(self.nlist)
+        parts = [self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes]
+        parts.extend(np.asarray(self.extra[int(p)], dtype=np.int32) for p in probes if self.extra.get(int(p)))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def search(self, matrix: Union[np.ndarray, QuantizedMatrix], query_vec: np.ndarray,
+               k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (rows, scores) of the approximate top-k by inner product"""
+        rows = self.candidate_rows(query_vec, nprobe)
+        if len(rows) == 0 or k <= 0:
+            return rows[:0], np.empty(0, dtype=np.float32)
+        rows = np.sort(rows)  # sequential access into a mapped matrix
+        scores = inner_products(matrix, query_vec, rows)
+        if k < len(rows):
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        ranked = np.argsort(-scores, kind="stable")
+        return rows[ranked], scores[ranked]
+
+    def save(self, directory: Path, tag: str) -> Dict[str, Any]:
+        """Write centroids and list layout as .npy files (extra rows folded in)"""
+        if any(self.extra.values()):
+            labels = np.empty(len(self.order) + sum(len(r) for r in self.extra.values()), dtype=np.int32)
+            for list_id in range(self.nlist):
+                labels[self.order[self.offsets[list_id]:self.offsets[list_id + 1]]] = list_id
+                labels[self.extra.get(list_id, [])] = list_id
+            order = np.argsort(labels, kind="stable").astype(np.int32)
+            counts = np.bincount(labels, minlength=self.nlist)
+            offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        else:
+            order, offsets = self.order, self.offsets
+
+        files = {
+            "centroids": f"ivf_centroids-{tag}.npy",
+            "order": f"ivf_order-{tag}.npy",
+            "offsets": f"ivf_offsets-{tag}.npy",
+        }
+        np.save(directory / files["centroids"], np.asarray(self.centroids, dtype=np.float32))
+        np.save(directory / files["order"], np.asarray(order, dtype=np.int32))
+        np.save(directory / files["offsets"], np.asarray(offsets, dtype=np.int64))
+        return files
+
+    @classmethod
+    def load(cls, directory: Path, entry: Dict[str, Any]) -> "IVFIndex":
+        """Memory-map an index written by save()"""
+        return cls(
+            np.load(directory / entry["centroids"]),
+            np.load(directory / entry["order"], mmap_mode="r"),
+            np.load(directory / entry["offsets"]),
+        )
+
+def _assign_all(centroids: np.ndarray, matrix: Any,
+                chunk_size: int = 65536) -> Tuple[np.ndarray, np.ndarray]:
+    """Assign every row of matrix to its nearest centroid: (order, offsets)"""
+    labels = np.empty(len(matrix), dtype=np.int32)
+    for start in range(0, len(matrix), chunk_size):
+        chunk = np.asarray(matrix[start:start + chunk_size], dtype=np.float32)
+        labels[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+    order = np.argsort(labels, kind="stable").astype(np.int32)
+    counts = np.bincount(labels, minlength=len(centroids))
+    offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+    return order, offsets
+
+def recall_at_k(approx: List[List[int]], exact: List[List[int]]) -> float:
+    """Mean fraction of the exact top-k ids that the approximate search found"""
+    if not exact:
+        return 1.0
+    total = 0.0
+    for found, truth in zip(approx, exact):
+        total += len(set(found) & set(truth)) / len(truth) if truth else 1.0
+    return total / len(exact)
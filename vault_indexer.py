@@ -13,15 +13,23 @@ Features:
 from __future__ import annotations
 
 import argparse
+import contextlib
 import hashlib
+import heapq
 import json
 import os
 import re
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Set, Tuple, Any
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union, Any
 from datetime import datetime
 import logging
+import multiprocessing
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -31,6 +39,19 @@ logger = logging.getLogger(__name__)
 DEFAULT_SOURCE = Path("codex_root/vault")
 DEFAULT_OUTPUT = Path("data/vault_index.json")
 DEFAULT_EXTENSIONS = {".md", ".markdown", ".txt", ".json", ".yaml"}
+INDEX_FORMATS = ("json", "jsonl", "sqlite")
+
+# Parallel indexing
+VAULT_INDEX_WORKERS = int(os.getenv("VAULT_INDEX_WORKERS", "0"))  # 0 = one per CPU, 1 = serial
+VAULT_INDEX_CHUNK = int(os.getenv("VAULT_INDEX_CHUNK", "64"))  # files per worker task
+
+# Incremental indexing: (mtime_ns, size, content hash) of every file seen by the last run
+MANIFEST_VERSION = 1
+
+# Watch mode
+VAULT_WATCH_INTERVAL = float(os.getenv("VAULT_WATCH_INTERVAL", "1.0"))  # seconds between change checks
+VAULT_WATCH_DEBOUNCE = float(os.getenv("VAULT_WATCH_DEBOUNCE", "2.0"))  # quiet time before re-indexing
+VAULT_WATCH_RESCAN = float(os.getenv("VAULT_WATCH_RESCAN", "300"))  # full stat-only pass; 0 = never
 
 # Privacy configuration
 IGNORE_TAGS = {
@@ -102,6 +123,25 @@ class VaultIndex:
     skipped: List[Tuple[str, str]] = field(default_factory=list)  # (path, reason)
     metadata: Dict[str, Any] = field(default_factory=dict)
 
+@dataclass
+class VaultIndexPatch:
+    """What an indexing run changed relative to the index it started from."""
+    order: List[str] = field(default_factory=list)  # every document path, in index order
+    documents: Dict[str, VaultDocument] = field(default_factory=dict)  # new or re-read documents by path
+    removed: List[str] = field(default_factory=list)  # paths of documents that left the index
+    duplicates: List[Tuple[str, str]] = field(default_factory=list)  # (path, reason)
+    skipped: List[Tuple[str, str]] = field(default_factory=list)  # (path, reason)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+    def apply(self, previous_docs: Dict[str, VaultDocument]) -> VaultIndex:
+        """The full index, taking unchanged documents from previous_docs (path -> document)."""
+        return VaultIndex(
+            documents=[self.documents.get(path) or previous_docs[path] for path in self.order],
+            duplicates=list(self.duplicates),
+            skipped=list(self.skipped),
+            metadata=dict(self.metadata),
+        )
+
 class EnhancedVaultIndexer:
     """Enhanced vault indexer with deduplication and rich field extraction."""
 
@@ -119,70 +159,298 @@ class EnhancedVaultIndexer:
         self.ignore_paths = ignore_paths or IGNORE_PATHS
         self.content_hashes: Dict[str, str] = {}  # sha256 -> path
         self.titles: Dict[str, str] = {}  # title -> path
+        self.manifest: Dict[str, Any] = {}  # written by index_vault()
+        self.bytes_read = 0  # file bytes read by the current run
+
+    def index_vault(
+        self,
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        *,
+        previous: Optional[VaultIndex] = None,
+        manifest: Optional[Dict[str, Any]] = None,
+        touched: Optional[Iterable[Path]] = None,
+    ) -> VaultIndex:
+        """Index the vault with enhanced processing.
+
+        Files are parsed on a process pool (workers, default
+        VAULT_INDEX_WORKERS) in chunks of chunk_size paths. Deduplication
+        and stats run here in sorted path order, so the index is the same
+        for any worker count.
+
+        Given the index and manifest of an earlier run, only files whose
+        mtime or size changed are read again; unchanged documents are taken
+        from previous and deleted files drop out (see index_changes(), which
+        needs only the previous document paths).
+        """
+        previous_docs = {doc.path: doc for doc in previous.documents} if previous is not None else None
+        patch = self.index_changes(
+            workers, chunk_size, previous_paths=previous_docs, manifest=manifest, touched=touched
+        )
+        return patch.apply(previous_docs or {})
 
-    def index_vault(self) -> VaultIndex:
-        """Index the vault with enhanced processing."""
-        index = VaultIndex()
+    def index_changes(
+        self,
+        workers: Optional[int] = None,
+        chunk_size: Optional[int] = None,
+        *,
+        previous_paths: Optional[Iterable[str]] = None,
+        manifest: Optional[Dict[str, Any]] = None,
+        touched: Optional[Iterable[Path]] = None,
+    ) -> VaultIndexPatch:
+        """Index the vault relative to an earlier run and return only what changed.
+
+        previous_paths are the document paths of the earlier run's index and
+        manifest its manifest; only files whose mtime or size changed are
+        read again, and the patch holds just those documents (plus any that
+        stopped being duplicates) and the paths that left the index. Without
+        them every file is read and every document is in the patch. The
+        manifest for the next run is left in self.manifest. With touched
+        (files or directories, as reported by a watcher) only those paths
+        are stat'ed instead of the whole vault.
+        """
+        patch = VaultIndexPatch()
         start_time = datetime.now()
+        self.content_hashes.clear()
+        self.titles.clear()
+        self.bytes_read = 0
+        previous: Set[str] = set(previous_paths or ())
 
         if not self.source.exists():
             logger.error(f"Source directory does not exist: {self.source}")
-            index.skipped.append((str(self.source), "missing_source"))
-            return index
+            patch.skipped.append((str(self.source), "missing_source"))
+            patch.removed = sorted(previous)
+            return patch
 
         logger.info(f"Starting vault indexing from: {self.source}")
 
-        for path in sorted(self.source.rglob("*")):
-            if not path.is_file():
-                continue
-
-            if not self._is_supported(path):
-                index.skipped.append((str(path), "unsupported_extension"))
-                continue
-
-            if self._is_private(path):
-                index.skipped.append((str(path), "private_tagged"))
-                continue
-
-            try:
-                doc = self._process_document(path)
-                if doc:
-                    # Check for duplicates
-                    dup_reason = self._check_duplicates(doc)
-                    if dup_reason:
-                        index.duplicates.append((doc.path, dup_reason))
-                        logger.info(f"Duplicate found: {doc.path} - {dup_reason}")
-                        continue
-
-                    index.documents.append(doc)
-                    logger.info(f"Indexed: {doc.path} (sections: {len(doc.sections)}, tables: {len(doc.tables)})")
-
-            except Exception as e:
-                logger.error(f"Error processing {path}: {e}")
-                index.skipped.append((str(path), f"processing_error: {e}"))
+        config = self._manifest_config()
+        known: Dict[str, Dict[str, Any]] = {}
+        if previous_paths is not None and manifest and manifest.get("version") == MANIFEST_VERSION \
+                and manifest.get("config") == config:
+            known = manifest.get("files", {})
+        kept = previous if known else set()  # documents that may be taken over unread
+
+        # Stat every file (or only the touched ones); only new or changed ones are read
+        if touched is not None and known:
+            files, stale = self._scan_touched(touched, known)
+        else:
+            files, stale = self._scan_all(known)
+
+        parsed: Dict[str, VaultDocument] = {}
+        workers = workers or VAULT_INDEX_WORKERS or os.cpu_count() or 1
+        chunk_size = max(1, chunk_size or VAULT_INDEX_CHUNK)
+        # One pool for the whole run: both parse passes below share its workers
+        with self._worker_pool(workers) if workers > 1 else contextlib.nullcontext() as pool:
+            self._parse_into(stale, files, parsed, pool, chunk_size)
+
+            # Deduplicate over the whole vault in path order
+            outcomes: List[Tuple[str, str, str]] = []  # (relative path, status, reason or "")
+            for rel, entry in files.items():
+                if entry.get("skipped"):
+                    outcomes.append((rel, "skipped", entry["skipped"]))
+                elif entry.get("content_sha256"):
+                    dup_reason = self._duplicate_reason(rel, entry["title"], entry["content_sha256"])
+                    outcomes.append((rel, "duplicate", dup_reason) if dup_reason else (rel, "document", ""))
+
+            # Unchanged files that are no longer duplicates were never kept; parse them now
+            missing = [
+                self.source / rel for rel, status, _ in outcomes
+                if status == "document" and rel not in parsed and rel not in kept
+            ]
+            self._parse_into(missing, files, parsed, pool, chunk_size)
+
+        for rel, status, reason in outcomes:
+            if status == "skipped":
+                patch.skipped.append((str(self.source / rel), reason))
+            elif status == "duplicate":
+                patch.duplicates.append((rel, reason))
+                logger.info(f"Duplicate found: {rel} - {reason}")
+            elif rel in parsed:
+                doc = parsed[rel]
+                patch.order.append(rel)
+                patch.documents[rel] = doc
+                logger.info(f"Indexed: {doc.path} (sections: {len(doc.sections)}, tables: {len(doc.tables)})")
+            elif rel in kept:
+                patch.order.append(rel)
+        patch.removed = sorted(previous.difference(patch.order))
+
+        self.manifest = {"version": MANIFEST_VERSION, "config": config, "files": files}
 
         # Calculate final metadata
         end_time = datetime.now()
-        index.metadata = {
+        patch.metadata = {
             "indexed_at": end_time.isoformat(),
             "processing_time_seconds": (end_time - start_time).total_seconds(),
-            "total_documents": len(index.documents),
-            "duplicates_found": len(index.duplicates),
-            "skipped_files": len(index.skipped),
+            "total_documents": len(patch.order),
+            "duplicates_found": len(patch.duplicates),
+            "skipped_files": len(patch.skipped),
             "source_directory": str(self.source),
-            "extensions_supported": list(self.extensions)
+            "extensions_supported": list(self.extensions),
+            "incremental": bool(known),
+            "files_reprocessed": len(stale) + len(missing),
+            "bytes_read": self.bytes_read,
         }
 
-        logger.info(f"Indexing complete: {len(index.documents)} documents, {len(index.duplicates)} duplicates, {len(index.skipped)} skipped")
-        return index
+        logger.info(f"Indexing complete: {len(patch.order)} documents, {len(patch.duplicates)} duplicates, {len(patch.skipped)} skipped")
+        return patch
 
-    def _process_document(self, path: Path) -> Optional[VaultDocument]:
-        """Process a single document and extract rich metadata."""
+    def _manifest_config(self) -> Dict[str, Any]:
+        """Settings that invalidate a manifest when they change"""
+        return {
+            "source": str(self.source),
+            "extensions": sorted(self.extensions),
+            "ignore_tags": sorted(self.ignore_tags),
+            "ignore_paths": list(self.ignore_paths),
+        }
+
+    def _scan_all(self, known: Dict[str, Dict[str, Any]]) -> Tuple[Dict[str, Dict[str, Any]], List[Path]]:
+        """Manifest entries of every file in the vault, sorted, plus the files that need reading"""
+        files: Dict[str, Dict[str, Any]] = {}  # relative path -> manifest entry, sorted
+        stale: List[Path] = []
+        for path in sorted(self.source.rglob("*")):
+            self._stat_into(path, known, files, stale)
+        return files, stale
+
+    def _scan_touched(
+        self, touched: Iterable[Path], known: Dict[str, Dict[str, Any]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[Path]]:
+        """Like _scan_all, but only touched paths are stat'ed; other entries are kept as they are.
+
+        A touched directory covers its direct children (a watcher reports
+        nested directories separately); a touched path that is no longer a
+        directory also drops everything the manifest had below it.
+        """
+        candidates: Set[str] = set()
+        for path in touched:
+            path = Path(path)
+            try:
+                rel = path.relative_to(self.source)
+            except ValueError:
+                continue
+            if path.is_dir():
+                try:
+                    candidates.update(str(child.relative_to(self.source)) for child in path.iterdir())
+                except OSError:
+                    pass
+                candidates.update(key for key in known if Path(key).parent == rel)
+            else:
+                candidates.add(str(rel))
+                prefix = f"{rel}{os.sep}"
+                candidates.update(key for key in known if key.startswith(prefix))
+
+        files = {key: entry for key, entry in known.items() if key not in candidates}
+        stale: List[Path] = []
+        for key in candidates:
+            self._stat_into(self.source / key, known, files, stale)
+        files = {key: files[key] for key in sorted(files, key=Path)}
+        return files, sorted(stale)
+
+    def _stat_into(
+        self, path: Path, known: Dict[str, Dict[str, Any]], files: Dict[str, Dict[str, Any]], stale: List[Path]
+    ) -> None:
+        """Record a file's manifest entry, reusing the known one if mtime and size match"""
+        try:
+            if not path.is_file():
+                return
+            stat = path.stat()
+        except OSError:
+            return
+        rel = str(path.relative_to(self.source))
+        entry = known.get(rel)
+        if entry and entry.get("mtime_ns") == stat.st_mtime_ns and entry.get("size") == stat.st_size:
+            files[rel] = entry
+        else:
+            files[rel] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+            stale.append(path)
+
+    def _parse_into(
+        self,
+        paths: List[Path],
+        files: Dict[str, Dict[str, Any]],
+        parsed: Dict[str, VaultDocument],
+        pool: Optional[ProcessPoolExecutor],
+        chunk_size: int,
+    ) -> None:
+        """Index paths, recording each outcome in its manifest entry and each document in parsed"""
+        for path, (status, value) in zip(paths, self._index_paths(paths, pool, chunk_size)):
+            rel = str(path.relative_to(self.source))
+            entry = files[rel]
+            entry.update(skipped=None, content_sha256=None, title=None)
+            if status == "skipped":
+                entry["skipped"] = value
+                if value.startswith("processing_error"):
+                    logger.error(f"Error processing {path}: {value}")
+                    entry["mtime_ns"] = None  # retry on the next run
+            elif value:
+                entry.update(content_sha256=value.content_sha256, title=value.title)
+                parsed[rel] = value
+
+    def _worker_pool(self, workers: int) -> ProcessPoolExecutor:
+        """Process pool for one indexing run; worker processes start on first submit"""
+        # spawn: watch mode indexes with the observer thread running, and
+        # forking a multi-threaded process can deadlock the workers
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.source, self.extensions, self.ignore_tags, self.ignore_paths),
+        )
+
+    def _index_paths(
+        self, paths: List[Path], pool: Optional[ProcessPoolExecutor], chunk_size: int
+    ) -> Iterator[Tuple[str, Any]]:
+        """Yield _index_path() outcomes in the order of paths, in-process or on pool"""
+        if pool is None or len(paths) <= chunk_size:
+            for path in paths:
+                yield self._index_path(path)
+            return
+
+        chunks = [paths[start:start + chunk_size] for start in range(0, len(paths), chunk_size)]
+        # Submitted up front; results are consumed in submission order
+        for future in [pool.submit(_index_chunk, chunk) for chunk in chunks]:
+            outcomes, bytes_read = future.result()
+            self.bytes_read += bytes_read
+            yield from outcomes
+
+    def _index_path(self, path: Path) -> Tuple[str, Any]:
+        """Filter and parse one file: ("skipped", reason) or ("document", VaultDocument or None)"""
+        if not self._is_supported(path):
+            return "skipped", "unsupported_extension"
+
+        if self._is_private_path(path):
+            return "skipped", "private_tagged"
+
+        # Read once; the privacy check and the parser share the text.
+        # Undecodable or unreadable files are treated as private.
+        content = self._read_text(path)
+        if content is None or self._is_private_content(content):
+            return "skipped", "private_tagged"
+
+        try:
+            return "document", self._process_document(path, content)
+        except Exception as e:
+            return "skipped", f"processing_error: {e}"
+
+    def _read_text(self, path: Path) -> Optional[str]:
+        """Read a file as UTF-8 text (newlines normalized like read_text), counting bytes read."""
         try:
-            content = path.read_text(encoding="utf-8")
+            data = path.read_bytes()
+        except OSError:
+            return None
+        self.bytes_read += len(data)
+        try:
+            return data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
         except UnicodeDecodeError:
             return None
 
+    def _process_document(self, path: Path, content: Optional[str] = None) -> Optional[VaultDocument]:
+        """Process a single document and extract rich metadata."""
+        if content is None:
+            content = self._read_text(path)
+            if content is None:
+                return None
+
         # Extract title
         title = self._extract_title(content, path)
 
@@ -394,22 +662,27 @@ class EnhancedVaultIndexer:
         content_tags = re.findall(hashtag_pattern, content)
         tags.update(content_tags)
 
-        return list(tags)
+        # Sorted, not set order: spawned workers each get their own hash seed
+        return sorted(tags)
 
     def _check_duplicates(self, doc: VaultDocument) -> Optional[str]:
         """Check for duplicates based on title and content hash."""
+        return self._duplicate_reason(doc.path, doc.title, doc.content_sha256)
+
+    def _duplicate_reason(self, path: str, title: str, content_sha256: str) -> Optional[str]:
+        """Duplicate check on the fields kept in the manifest."""
         # Check content hash duplicate
-        if doc.content_sha256 in self.content_hashes:
-            return f"content_duplicate_of_{self.content_hashes[doc.content_sha256]}"
+        if content_sha256 in self.content_hashes:
+            return f"content_duplicate_of_{self.content_hashes[content_sha256]}"
 
         # Check title duplicate
-        title_key = doc.title.lower().strip()
+        title_key = title.lower().strip()
         if title_key in self.titles:
             return f"title_duplicate_of_{self.titles[title_key]}"
 
         # Register for future duplicate checks
-        self.content_hashes[doc.content_sha256] = doc.path
-        self.titles[title_key] = doc.path
+        self.content_hashes[content_sha256] = path
+        self.titles[title_key] = path
 
         return None
 
@@ -417,8 +690,8 @@ class EnhancedVaultIndexer:
         """Check if file extension is supported."""
         return path.suffix.lower() in self.extensions
 
-    def _is_private(self, path: Path) -> bool:
-        """Enhanced privacy checking."""
+    def _is_private_path(self, path: Path) -> bool:
+        """Privacy markers that need no file read."""
         # Check path patterns
         if self._looks_private_path(str(path)):
             return True
@@ -428,25 +701,17 @@ class EnhancedVaultIndexer:
         if any(f"#{tag}" in name_lower or tag in name_lower for tag in self.ignore_tags):
             return True
 
-        # Check file content
-        try:
-            content = path.read_text(encoding="utf-8")
-
-            # Check frontmatter
-            if self._has_private_frontmatter(content):
-                return True
-
-            # Check content for privacy tags
-            content_lower = content.lower()
-            if any(f"#{tag}" in content_lower for tag in self.ignore_tags):
-                return True
+        return False
 
-        except UnicodeDecodeError:
-            return True
-        except OSError:
+    def _is_private_content(self, content: str) -> bool:
+        """Check already-loaded file content for privacy markers."""
+        # Check frontmatter
+        if self._has_private_frontmatter(content):
             return True
 
-        return False
+        # Check content for privacy tags
+        content_lower = content.lower()
+        return any(f"#{tag}" in content_lower for tag in self.ignore_tags)
 
     def _looks_private_path(self, path_str: str) -> bool:
         """Check if path matches privacy patterns."""
@@ -487,48 +752,591 @@ class EnhancedVaultIndexer:
 
         return False
 
-def write_index(index: VaultIndex, output_path: Path) -> None:
-    """Write vault index to JSON file."""
-    # Convert to dict for JSON serialization
-    index_dict = {
-        "metadata": index.metadata,
-        "documents": [
+_worker_indexer: Optional[EnhancedVaultIndexer] = None
+
+def _init_worker(source: Path, extensions: Set[str], ignore_tags: Set[str], ignore_paths: List[str]) -> None:
+    """Give each pool process its own indexer with the parent's settings."""
+    global _worker_indexer
+    _worker_indexer = EnhancedVaultIndexer(
+        source, extensions=extensions, ignore_tags=ignore_tags, ignore_paths=ignore_paths
+    )
+
+def _index_chunk(paths: List[Path]) -> Tuple[List[Tuple[str, Any]], int]:
+    """Worker task: filter and parse a chunk of files (no dedup; the parent does that).
+
+    Returns the outcomes and the bytes read for them.
+    """
+    indexer = _worker_indexer
+    assert indexer is not None, "vault indexing worker was not initialized"
+    indexer.bytes_read = 0
+    return [indexer._index_path(path) for path in paths], indexer.bytes_read
+
+def index_format(index_path: Path) -> str:
+    """Index format implied by the file suffix: json, jsonl or sqlite."""
+    suffix = index_path.suffix.lower()
+    if suffix == ".jsonl":
+        return "jsonl"
+    if suffix in (".sqlite", ".db"):
+        return "sqlite"
+    return "json"
+
+def _document_record(doc: VaultDocument) -> Dict[str, Any]:
+    """JSON-ready dict of a document, in the field order of the JSON index."""
+    return {
+        "title": doc.title,
+        "path": doc.path,
+        "full_path": doc.full_path,
+        "content": doc.content,
+        "content_sha256": doc.content_sha256,
+        "sections": [
             {
-                "title": doc.title,
-                "path": doc.path,
-                "full_path": doc.full_path,
-                "content": doc.content,
-                "content_sha256": doc.content_sha256,
-                "sections": [
-                    {
-                        "type": sec.type,
-                        "title": sec.title,
-                        "level": sec.level,
-                        "content": sec.content,
-                        "language": sec.language,
-                        "rows": sec.rows,
-                        "metadata": sec.metadata
-                    } for sec in doc.sections
-                ],
-                "tables": doc.tables,
-                "weight": doc.weight,
-                "tags": doc.tags,
-                "frontmatter": doc.frontmatter,
-                "created_at": doc.created_at,
-                "modified_at": doc.modified_at,
-                "word_count": doc.word_count,
-                "char_count": doc.char_count,
-                "is_private": doc.is_private
-            } for doc in index.documents
+                "type": sec.type,
+                "title": sec.title,
+                "level": sec.level,
+                "content": sec.content,
+                "language": sec.language,
+                "rows": sec.rows,
+                "metadata": sec.metadata
+            } for sec in doc.sections
         ],
-        "duplicates": index.duplicates,
-        "skipped": index.skipped
+        "tables": doc.tables,
+        "weight": doc.weight,
+        "tags": doc.tags,
+        "frontmatter": doc.frontmatter,
+        "created_at": doc.created_at,
+        "modified_at": doc.modified_at,
+        "word_count": doc.word_count,
+        "char_count": doc.char_count,
+        "is_private": doc.is_private
     }
 
+def _document_from_record(record: Dict[str, Any]) -> VaultDocument:
+    record = dict(record)
+    record["sections"] = [Section(**sec) for sec in record.get("sections", [])]
+    return VaultDocument(**record)
+
+def _replace_atomically(output_path: Path, write: Callable[[Path], object]) -> None:
+    """Run write(tmp_path), then move the result over output_path in one step.
+
+    The temp file gets a unique name, so concurrent writers (a cron run and
+    the watcher) never clobber each other's half-written file.
+    """
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    output_path.write_text(json.dumps(index_dict, indent=2, ensure_ascii=False), encoding="utf-8")
+    fd, tmp_name = tempfile.mkstemp(dir=output_path.parent, prefix=output_path.name + ".", suffix=".tmp")
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+def write_index(index: VaultIndex, output_path: Path, fmt: Optional[str] = None) -> None:
+    """Write the vault index as JSON, JSONL or SQLite (fmt, default from the suffix).
+
+    Documents are serialized one at a time, and the file is replaced
+    atomically, so readers never see a partial index.
+    """
+    fmt = fmt or index_format(output_path)
+    writers = {"json": _write_json, "jsonl": _write_jsonl, "sqlite": _write_sqlite}
+    if fmt not in writers:
+        raise ValueError(f"Unknown index format {fmt!r}; expected one of {INDEX_FORMATS}")
+    _replace_atomically(output_path, lambda tmp_path: writers[fmt](index, tmp_path))
     logger.info(f"Vault index written to: {output_path}")
 
+def _write_json(index: VaultIndex, output_path: Path) -> None:
+    index_dict = {
+        "metadata": index.metadata,
+        "documents": [_document_record(doc) for doc in index.documents],
+        "duplicates": index.duplicates,
+        "skipped": index.skipped
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(index_dict, f, indent=2, ensure_ascii=False)
+
+def _write_jsonl(index: VaultIndex, output_path: Path) -> None:
+    with open(output_path, "w", encoding="utf-8") as f:
+        def emit(record: Dict[str, Any]) -> None:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        emit({"type": "metadata", "metadata": index.metadata})
+        for doc in index.documents:
+            emit({"type": "document", **_document_record(doc)})
+        for path, reason in index.duplicates:
+            emit({"type": "duplicate", "path": path, "reason": reason})
+        for path, reason in index.skipped:
+            emit({"type": "skipped", "path": path, "reason": reason})
+
+SQLITE_SCHEMA = """
+CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE documents (
+    position INTEGER PRIMARY KEY, path TEXT UNIQUE, title TEXT, full_path TEXT,
+    content_sha256 TEXT, weight REAL, tags TEXT, frontmatter TEXT, tables TEXT,
+    created_at TEXT, modified_at TEXT, word_count INTEGER, char_count INTEGER, is_private INTEGER
+);
+CREATE TABLE contents (path TEXT PRIMARY KEY, content TEXT);
+CREATE TABLE sections (
+    path TEXT, position INTEGER, type TEXT, title TEXT, level INTEGER, content TEXT,
+    language TEXT, rows INTEGER, metadata TEXT, PRIMARY KEY (path, position)
+);
+CREATE TABLE tags (path TEXT, tag TEXT);
+CREATE INDEX tags_by_tag ON tags (tag);
+CREATE TABLE duplicates (position INTEGER PRIMARY KEY, path TEXT, reason TEXT);
+CREATE TABLE skipped (position INTEGER PRIMARY KEY, path TEXT, reason TEXT);
+"""
+
+# documents columns holding JSON text
+_JSON_COLUMNS = ("tags", "frontmatter", "tables")
+
+def _write_sqlite(index: VaultIndex, output_path: Path) -> None:
+    conn = sqlite3.connect(str(output_path))
+    try:
+        conn.executescript(SQLITE_SCHEMA)
+        _write_sqlite_rows(conn, index.metadata, index.duplicates, index.skipped)
+        for position, doc in enumerate(index.documents):
+            _insert_sqlite_document(conn, position, doc)
+        conn.commit()
+    finally:
+        conn.close()
+
+def _insert_sqlite_document(conn: sqlite3.Connection, position: int, doc: VaultDocument) -> None:
+    """Insert a document, replacing the row of the same path; its sections and tags must be gone"""
+    conn.execute(
+        "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (position, doc.path, doc.title, doc.full_path, doc.content_sha256, doc.weight,
+         json.dumps(doc.tags, ensure_ascii=False), json.dumps(doc.frontmatter, ensure_ascii=False),
+         json.dumps(doc.tables, ensure_ascii=False), doc.created_at, doc.modified_at,
+         doc.word_count, doc.char_count, int(doc.is_private)),
+    )
+    conn.execute("INSERT OR REPLACE INTO contents VALUES (?, ?)", (doc.path, doc.content))
+    conn.executemany(
+        "INSERT INTO sections VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((doc.path, i, sec.type, sec.title, sec.level, sec.content, sec.language, sec.rows,
+          json.dumps(sec.metadata, ensure_ascii=False)) for i, sec in enumerate(doc.sections)),
+    )
+    conn.executemany("INSERT INTO tags VALUES (?, ?)", ((doc.path, tag) for tag in doc.tags))
+
+def _write_sqlite_rows(conn: sqlite3.Connection, metadata: Dict[str, Any],
+                       duplicates: List[Tuple[str, str]], skipped: List[Tuple[str, str]]) -> None:
+    """Replace the metadata, duplicates and skipped tables"""
+    for table in ("metadata", "duplicates", "skipped"):
+        conn.execute(f"DELETE FROM {table}")
+    conn.executemany(
+        "INSERT INTO metadata VALUES (?, ?)",
+        ((key, json.dumps(value, ensure_ascii=False)) for key, value in metadata.items()),
+    )
+    conn.executemany("INSERT INTO duplicates VALUES (?, ?, ?)",
+                     ((i, path, reason) for i, (path, reason) in enumerate(duplicates)))
+    conn.executemany("INSERT INTO skipped VALUES (?, ?, ?)",
+                     ((i, path, reason) for i, (path, reason) in enumerate(skipped)))
+
+def _patch_sqlite(patch: VaultIndexPatch, index_path: Path) -> None:
+    """Apply a patch in one transaction: rows are deleted and upserted by path, never rewritten wholesale"""
+    conn = sqlite3.connect(str(index_path))
+    try:
+        with conn:
+            removed = [(path,) for path in patch.removed]
+            for table in ("documents", "contents", "sections", "tags"):
+                conn.executemany(f"DELETE FROM {table} WHERE path = ?", removed)
+            for table in ("sections", "tags"):
+                conn.executemany(f"DELETE FROM {table} WHERE path = ?", ((path,) for path in patch.documents))
+
+            # Renumber rows whose position shifted, parking them on negative positions first
+            # so no two rows ever share one; bodies and sections are keyed on path and stay put
+            positions = {path: position for position, path in enumerate(patch.order)}
+            moved = [
+                (positions[path], path)
+                for path, position in conn.execute("SELECT path, position FROM documents")
+                if positions[path] != position
+            ]
+            conn.executemany("UPDATE documents SET position = ? WHERE path = ?",
+                             ((-1 - position, path) for position, path in moved))
+            conn.executemany("UPDATE documents SET position = ? WHERE path = ?", moved)
+
+            for path, doc in patch.documents.items():
+                _insert_sqlite_document(conn, positions[path], doc)
+            _write_sqlite_rows(conn, patch.metadata, patch.duplicates, patch.skipped)
+    finally:
+        conn.close()
+
+def patch_index(patch: VaultIndexPatch, output_path: Path, fmt: Optional[str] = None) -> None:
+    """Apply an incremental run's changes to the index written earlier at output_path.
+
+    Only new and re-read documents are serialized. SQLite is patched in
+    place in one transaction: removed documents are deleted and new or
+    re-read ones upserted by path. JSONL streams the old file into an
+    atomically replaced copy, keeping unchanged document lines as they are.
+    The legacy JSON format has no per-document records and is loaded and
+    rewritten whole.
+    """
+    fmt = fmt or index_format(output_path)
+    if not output_path.exists():
+        raise FileNotFoundError(f"No vault index to patch at {output_path}")
+    if fmt == "sqlite":
+        _patch_sqlite(patch, output_path)
+    elif fmt == "jsonl":
+        _replace_atomically(output_path, lambda tmp_path: _patch_jsonl(patch, output_path, tmp_path))
+    else:
+        previous = load_index(output_path)
+        if previous is None:
+            raise ValueError(f"Could not read vault index {output_path}")
+        write_index(patch.apply({doc.path: doc for doc in previous.documents}), output_path, fmt)
+        return
+    logger.info(f"Vault index patched: {output_path} ({len(patch.documents)} written, {len(patch.removed)} removed)")
+
+def _patch_jsonl(patch: VaultIndexPatch, source_path: Path, output_path: Path) -> None:
+    rank = {path: position for position, path in enumerate(patch.order)}
+    with open(source_path, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as f:
+        def emit(record: Dict[str, Any]) -> None:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+        emit({"type": "metadata", "metadata": patch.metadata})
+        # Unchanged lines keep their relative order, so the two streams merge by position
+        unchanged = (
+            (rank[record["path"]], line.rstrip("\n") + "\n")
+            for line, record in ((line, json.loads(line)) for line in src if line.strip())
+            if record.get("type") == "document" and record["path"] in rank and record["path"] not in patch.documents
+        )
+        changed = sorted(
+            (rank[path], json.dumps({"type": "document", **_document_record(doc)}, ensure_ascii=False) + "\n")
+            for path, doc in patch.documents.items()
+        )
+        for _, line in heapq.merge(unchanged, changed, key=lambda item: item[0]):
+            f.write(line)
+        for path, reason in patch.duplicates:
+            emit({"type": "duplicate", "path": path, "reason": reason})
+        for path, reason in patch.skipped:
+            emit({"type": "skipped", "path": path, "reason": reason})
+
+def iter_documents(index_path: Path, with_content: bool = False) -> Iterator[Dict[str, Any]]:
+    """Yield document records from an index of any format, in index order.
+
+    Without with_content the records omit "content" and "sections", and the
+    JSONL and SQLite formats never materialize more than one document.
+    """
+    fmt = index_format(index_path)
+    if fmt == "sqlite":
+        yield from _iter_sqlite_documents(index_path, with_content)
+        return
+
+    if fmt == "jsonl":
+        with open(index_path, encoding="utf-8") as f:
+            records = (json.loads(line) for line in f if line.strip())
+            documents = (record for record in records if record.pop("type", None) == "document")
+            yield from (_strip_bodies(record, with_content) for record in documents)
+        return
+
+    data = json.loads(index_path.read_text(encoding="utf-8"))
+    yield from (_strip_bodies(record, with_content) for record in data.get("documents", []))
+
+def _strip_bodies(record: Dict[str, Any], with_content: bool) -> Dict[str, Any]:
+    if not with_content:
+        record.pop("content", None)
+        record.pop("sections", None)
+    return record
+
+def _iter_sqlite_documents(index_path: Path, with_content: bool) -> Iterator[Dict[str, Any]]:
+    conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    try:
+        for row in conn.execute("SELECT * FROM documents ORDER BY position"):
+            record = dict(row)
+            del record["position"]
+            for column in _JSON_COLUMNS:
+                record[column] = json.loads(record[column])
+            record["is_private"] = bool(record["is_private"])
+            if with_content:
+                (record["content"],) = conn.execute(
+                    "SELECT content FROM contents WHERE path = ?", (record["path"],)).fetchone()
+                record["sections"] = [
+                    {
+                        "type": sec["type"], "title": sec["title"], "level": sec["level"],
+                        "content": sec["content"], "language": sec["language"], "rows": sec["rows"],
+                        "metadata": json.loads(sec["metadata"]),
+                    }
+                    for sec in conn.execute(
+                        "SELECT * FROM sections WHERE path = ? ORDER BY position", (record["path"],))
+                ]
+            yield record
+    finally:
+        conn.close()
+
+def read_metadata(index_path: Path) -> Dict[str, Any]:
+    """Index metadata; for JSONL and SQLite this reads no document bodies."""
+    fmt = index_format(index_path)
+    if fmt == "sqlite":
+        conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        try:
+            return {key: json.loads(value) for key, value in conn.execute("SELECT key, value FROM metadata")}
+        finally:
+            conn.close()
+    if fmt == "jsonl":
+        with open(index_path, encoding="utf-8") as f:
+            first = json.loads(f.readline() or "{}")
+        return first.get("metadata", {})
+    return json.loads(index_path.read_text(encoding="utf-8")).get("metadata", {})
+
+def read_document_paths(index_path: Path) -> Optional[List[str]]:
+    """Document paths of an index in order, without their bodies; None if missing or unreadable."""
+    try:
+        return [record["path"] for record in iter_documents(index_path)]
+    except (OSError, ValueError, TypeError, KeyError, sqlite3.Error) as e:
+        if index_path.exists():
+            logger.warning(f"Could not read vault index {index_path}: {e}")
+        return None
+
+def _read_pairs(index_path: Path) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """(duplicates, skipped) of a JSONL or SQLite index."""
+    fmt = index_format(index_path)
+    if fmt == "sqlite":
+        conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+        try:
+            duplicates, skipped = (
+                [(path, reason) for path, reason in conn.execute(f"SELECT path, reason FROM {table} ORDER BY position")]
+                for table in ("duplicates", "skipped")
+            )
+            return duplicates, skipped
+        finally:
+            conn.close()
+    pairs: Dict[str, List[Tuple[str, str]]] = {"duplicate": [], "skipped": []}
+    with open(index_path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line) if line.strip() else {}
+            if record.get("type") in pairs:
+                pairs[record["type"]].append((record["path"], record["reason"]))
+    return pairs["duplicate"], pairs["skipped"]
+
+def load_index(index_path: Path) -> Optional[VaultIndex]:
+    """Read a vault index written by write_index(); None if missing or unreadable."""
+    try:
+        if index_format(index_path) == "json":
+            data = json.loads(index_path.read_text(encoding="utf-8"))
+            return VaultIndex(
+                documents=[_document_from_record(record) for record in data.get("documents", [])],
+                duplicates=[tuple(item) for item in data.get("duplicates", [])],
+                skipped=[tuple(item) for item in data.get("skipped", [])],
+                metadata=data.get("metadata", {}),
+            )
+        documents = [_document_from_record(record) for record in iter_documents(index_path, with_content=True)]
+        duplicates, skipped = _read_pairs(index_path)
+        metadata = read_metadata(index_path)
+    except (OSError, ValueError, TypeError, KeyError, sqlite3.Error) as e:
+        if index_path.exists():
+            logger.warning(f"Could not read vault index {index_path}: {e}")
+        return None
+    return VaultIndex(documents=documents, duplicates=duplicates, skipped=skipped, metadata=metadata)
+
+def export_json(index_path: Path, json_path: Path) -> None:
+    """Write the legacy JSON index from a JSONL or SQLite index."""
+    index = load_index(index_path)
+    if index is None:
+        raise FileNotFoundError(f"No readable vault index at {index_path}")
+    write_index(index, json_path, "json")
+
+def manifest_path_for(output_path: Path) -> Path:
+    """Manifest kept next to an index (data/vault_index.manifest.json)."""
+    return output_path.with_name(f"{output_path.stem}.manifest.json")
+
+def load_manifest(manifest_path: Path) -> Dict[str, Any]:
+    """Read an indexing manifest; empty (forcing a full run) if missing or unreadable."""
+    try:
+        return json.loads(manifest_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+def write_manifest(manifest: Dict[str, Any], manifest_path: Path) -> None:
+    """Write the manifest atomically, after the index it describes."""
+    _replace_atomically(
+        manifest_path,
+        lambda tmp_path: tmp_path.write_text(json.dumps(manifest, ensure_ascii=False), encoding="utf-8"),
+    )
+
+class DirectoryPoller:
+    """Change source for watch mode without inotify; stats directories only.
+
+    A directory's mtime changes when entries are created, deleted or renamed
+    in it, which covers new notes, deletions and editors that save by
+    renaming a temp file. In-place rewrites of an existing file do not touch
+    the directory; the watcher's periodic rescan picks those up.
+    """
+
+    def __init__(self, source: Path) -> None:
+        self.source = source
+        self.dirs: Dict[Path, int] = {}  # directory -> mtime_ns
+        self._add_tree(source)
+
+    def _add_tree(self, root: Path) -> List[Path]:
+        added = []
+        for dirpath, _, _ in os.walk(root):
+            path = Path(dirpath)
+            try:
+                self.dirs[path] = path.stat().st_mtime_ns
+            except OSError:
+                continue
+            added.append(path)
+        return added
+
+    def changes(self) -> Set[Path]:
+        """Directories created, removed or changed since the last call"""
+        touched: Set[Path] = set()
+        for path, mtime_ns in list(self.dirs.items()):
+            try:
+                current = path.stat().st_mtime_ns
+            except OSError:
+                del self.dirs[path]
+                touched.add(path)
+                continue
+            if current == mtime_ns:
+                continue
+            self.dirs[path] = current
+            touched.add(path)
+            try:
+                for child in path.iterdir():
+                    if child.is_dir() and child not in self.dirs:
+                        touched.update(self._add_tree(child))
+            except OSError:
+                pass
+        return touched
+
+    def close(self) -> None:
+        pass
+
+class _WatchdogSource:
+    """Change source backed by watchdog (inotify on Linux)."""
+
+    IGNORED_EVENTS = {"opened", "closed_no_write"}
+
+    def __init__(self, source: Path) -> None:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        self._lock = threading.Lock()
+        self._touched: Set[Path] = set()
+        record = self._record
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event: Any) -> None:
+                record(event)
+
+        self._observer = Observer()
+        self._observer.schedule(Handler(), str(source), recursive=True)
+        self._observer.start()
+
+    def _record(self, event: Any) -> None:
+        if event.event_type in self.IGNORED_EVENTS:
+            return
+        paths = [event.src_path] + ([event.dest_path] if getattr(event, "dest_path", "") else [])
+        with self._lock:
+            for raw in paths:
+                path = Path(os.fsdecode(raw))
+                self._touched.add(path)
+                if event.is_directory and path.is_dir():
+                    # Created or moved in: cover every directory below it
+                    self._touched.update(Path(dirpath) for dirpath, _, _ in os.walk(path))
+
+    def changes(self) -> Set[Path]:
+        with self._lock:
+            touched, self._touched = self._touched, set()
+        return touched
+
+    def close(self) -> None:
+        self._observer.stop()
+        self._observer.join()
+
+class VaultWatcher:
+    """Keep a vault index up to date as notes change.
+
+    Changes are collected until the vault has been quiet for debounce
+    seconds; then only the touched paths are re-indexed and just their
+    documents are patched into the index (see patch_index()) before the
+    manifest is replaced. Every rescan seconds (0 disables) a
+    stat-only pass over the whole vault catches edits the change source
+    cannot see. Uses watchdog (inotify) when installed, else DirectoryPoller.
+    """
+
+    def __init__(
+        self,
+        indexer: EnhancedVaultIndexer,
+        output_path: Path,
+        *,
+        interval: Optional[float] = None,
+        debounce: Optional[float] = None,
+        rescan: Optional[float] = None,
+        workers: Optional[int] = None,
+        polling: bool = False,
+    ) -> None:
+        self.indexer = indexer
+        self.output_path = output_path
+        self.manifest_path = manifest_path_for(output_path)
+        self.interval = VAULT_WATCH_INTERVAL if interval is None else interval
+        self.debounce = VAULT_WATCH_DEBOUNCE if debounce is None else debounce
+        self.rescan = VAULT_WATCH_RESCAN if rescan is None else rescan
+        self.workers = workers
+        self.polling = polling
+        self.paths: Optional[List[str]] = None  # document paths of the index on disk
+        self.manifest: Dict[str, Any] = {}
+        self._stop = threading.Event()
+
+    def _open_changes(self) -> Union[DirectoryPoller, _WatchdogSource]:
+        if not self.polling:
+            try:
+                return _WatchdogSource(self.indexer.source)
+            except ImportError:
+                logger.info("watchdog not installed; polling directories for changes")
+        return DirectoryPoller(self.indexer.source)
+
+    def update(self, touched: Optional[Iterable[Path]] = None) -> VaultIndexPatch:
+        """Re-index touched paths (everything if None) and apply the changes if there are any"""
+        patch = self.indexer.index_changes(
+            self.workers, previous_paths=self.paths, manifest=self.manifest, touched=touched
+        )
+        manifest = self.indexer.manifest
+        unchanged = patch.metadata.get("files_reprocessed") == 0 \
+            and manifest.get("files", {}).keys() == self.manifest.get("files", {}).keys()
+        if not unchanged:
+            if patch.metadata.get("incremental"):
+                patch_index(patch, self.output_path)
+            else:
+                write_index(patch.apply({}), self.output_path)
+            write_manifest(manifest, self.manifest_path)
+        self.paths, self.manifest = patch.order, manifest
+        return patch
+
+    def run(self, full: bool = False) -> None:
+        """Bring the index up to date, then follow changes until stop()."""
+        self.manifest = {} if full else load_manifest(self.manifest_path)
+        self.paths = read_document_paths(self.output_path) if self.manifest else None
+        changes = self._open_changes()  # opened first so edits during the initial pass are seen
+        try:
+            self.update()
+            logger.info(f"Watching {self.indexer.source} for changes")
+            pending: Set[Path] = set()
+            last_change = last_scan = time.monotonic()
+            while not self._stop.wait(self.interval):
+                touched = changes.changes()
+                now = time.monotonic()
+                if touched:
+                    pending |= touched
+                    last_change = now
+                try:
+                    if pending and now - last_change >= self.debounce:
+                        patch = self.update(pending)
+                        logger.info(f"Re-indexed {len(pending)} changed paths "
+                                    f"({patch.metadata.get('files_reprocessed', 0)} files read)")
+                        pending = set()
+                    elif not pending and self.rescan and now - last_scan >= self.rescan:
+                        self.update()
+                        last_scan = now
+                except Exception as e:
+                    # Keep the pending paths and retry on the next tick
+                    logger.error(f"Watch update failed: {e}")
+        finally:
+            changes.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+
 def parse_args() -> argparse.Namespace:
     """Parse command line arguments."""
     parser = argparse.ArgumentParser(description="Enhanced OMAi Vault Indexer")
@@ -542,7 +1350,7 @@ def parse_args() -> argparse.Namespace:
         "--output",
         type=Path,
         default=DEFAULT_OUTPUT,
-        help="Output path for vault index JSON."
+        help="Output path for the vault index (.json, .jsonl or .sqlite)."
     )
     parser.add_argument(
         "--extensions",
@@ -550,6 +1358,39 @@ def parse_args() -> argparse.Namespace:
         default=None,
         help="File extensions to include."
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Indexing processes (default: VAULT_INDEX_WORKERS or one per CPU; 1 = serial)."
+    )
+    parser.add_argument(
+        "--export-json",
+        type=Path,
+        default=None,
+        help="Export the index at --output to the legacy JSON format at this path and exit."
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Keep running and re-index notes as they change."
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="In watch mode, poll directory mtimes even if watchdog (inotify) is installed."
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=None,
+        help="Seconds of quiet before re-indexing in watch mode (default: VAULT_WATCH_DEBOUNCE)."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Re-read every file instead of only those changed since the last run."
+    )
     parser.add_argument(
         "--verbose",
         action="store_true",
@@ -564,6 +1405,11 @@ def main() -> None:
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    if args.export_json:
+        export_json(args.output, args.export_json)
+        print(f"Exported {args.output} to {args.export_json}")
+        return
+
     extensions = set(args.extensions) if args.extensions else None
 
     indexer = EnhancedVaultIndexer(
@@ -571,15 +1417,35 @@ def main() -> None:
         extensions=extensions
     )
 
-    index = indexer.index_vault()
-    write_index(index, args.output)
+    if args.watch:
+        watcher = VaultWatcher(indexer, args.output, debounce=args.debounce,
+                               workers=args.workers, polling=args.poll)
+        try:
+            watcher.run(full=args.full)
+        except KeyboardInterrupt:
+            print("\nVault watch stopped")
+        return
+
+    # Incremental runs only need the previous document paths; the index is patched in place
+    manifest_path = manifest_path_for(args.output)
+    manifest = {} if args.full else load_manifest(manifest_path)
+    previous_paths = read_document_paths(args.output) if manifest else None
+
+    patch = indexer.index_changes(workers=args.workers, previous_paths=previous_paths, manifest=manifest)
+    if patch.metadata.get("incremental"):
+        patch_index(patch, args.output)
+    else:
+        write_index(patch.apply({}), args.output)
+    write_manifest(indexer.manifest, manifest_path)
 
     print(f"\nVault indexing complete:")
-    print(f"  Documents indexed: {len(index.documents)}")
-    print(f"  Duplicates found: {len(index.duplicates)}")
-    print(f"  Files skipped: {len(index.skipped)}")
+    print(f"  Documents indexed: {len(patch.order)}")
+    print(f"  Duplicates found: {len(patch.duplicates)}")
+    print(f"  Files skipped: {len(patch.skipped)}")
+    print(f"  Files re-read: {patch.metadata.get('files_reprocessed', 0)}")
+    print(f"  Bytes read: {patch.metadata.get('bytes_read', 0)}")
     print(f"  Output written to: {args.output}")
-    print(f"  Processing time: {index.metadata.get('processing_time_seconds', 0):.2f}s")
+    print(f"  Processing time: {patch.metadata.get('processing_time_seconds', 0):.2f}s")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file